@@ -0,0 +1,20 @@
+#version 330
+
+// arcade binds the window projection to this block
+uniform Projection {
+    uniform mat4 matrix;
+} proj;
+
+// camera zoom and pan, the geometry itself is never rebuilt to move the view
+uniform float zoom;
+uniform vec2 offset;
+
+in vec2 in_vert;
+in vec4 in_color;
+
+out vec4 v_color;
+
+void main() {
+    gl_Position = proj.matrix * vec4(in_vert * zoom + offset, 0.0, 1.0);
+    v_color = in_color;
+}
@@ -2,36 +2,54 @@
 
 layout(local_size_x = 256) in;
 
-// Buffer for entity positions
-layout(std430, binding = 0) buffer PositionBuffer {
+// Buffers for entity positions and angles, read from one pair and written to the other
+layout(std430, binding = 0) readonly buffer PositionBuffer {
     vec2 in_pos[];
 };
-layout(std430, binding = 1) buffer AngleBuffer {
+layout(std430, binding = 1) readonly buffer AngleBuffer {
     float in_angles[];
 };
+layout(std430, binding = 2) writeonly buffer OutPositionBuffer {
+    vec2 out_pos[];
+};
+layout(std430, binding = 3) writeonly buffer OutAngleBuffer {
+    float out_angles[];
+};
 
+const float PI = 3.14159265358979;
 
 // Uniforms
 uniform vec2 targetPos;  // Target position
 uniform float deltaTime; // Time step
+uniform float speed;     // Pixels per second
+uniform float turnRate;  // Radians per second
+uniform uint count;      // Number of entities, the buffers may be larger
 
 void main() {
     uint idx = gl_GlobalInvocationID.x;
 
-    if (idx >= in_pos.length()) {
+    if (idx >= count) {
         return;
     }
 
-    // Current position of the entity
+    // Current position and heading of the entity
     vec2 pos = in_pos[idx].xy;
+    float angle = in_angles[idx];
+
+    // Turn towards the target, at most turnRate radians per second
+    vec2 toTarget = targetPos - pos;
+    if (toTarget.x != 0.0 || toTarget.y != 0.0) {
+        float turn = atan(toTarget.y, toTarget.x) - angle;
+        turn = mod(turn + PI, 2.0 * PI) - PI;
+        float limit = turnRate * deltaTime;
+        angle += clamp(turn, -limit, limit);
+    }
 
-    // Calculate the angle to the target
-    float angle = atan(targetPos.y - pos.y, targetPos.x - pos.x);
-
-    // Update position based on the angle
-    pos.x += cos(angle) * 2.0 * deltaTime;
-    pos.y += sin(angle) * 2.0 * deltaTime;
+    // Move forward along the new heading
+    pos.x += cos(angle) * speed * deltaTime;
+    pos.y += sin(angle) * speed * deltaTime;
 
-    // Write the updated position back to the buffer
-    in_pos[idx].xy = pos;
+    // Write the updated position and heading to the other buffers
+    out_pos[idx].xy = pos;
+    out_angles[idx] = angle;
 }
@@ -35,6 +35,7 @@ class Actor:
 
     def __post_init__(self):
         self.party = None
+        self.faction = None
 
         # set max stats to current stats
         self.statistics.max_health = self.statistics.health
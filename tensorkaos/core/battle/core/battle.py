@@ -2,9 +2,12 @@ import logging
 
 from dataclasses import dataclass, field
 
+import numpy as np
+
 from .actor import Actor, ActorStats
 from .party import Party
 from .settings import GameSettings
+from ...engine.ecs import EntityStore
 
 
 log = logging.getLogger(__name__)
@@ -13,9 +16,14 @@ log = logging.getLogger(__name__)
 class Battle:
     def __init__(self):
         self.turn = 0
-        self.turn_meter = {}
+        # one entity per actor, its turn meter and total stats, ticked down in bulk
+        self.entities = EntityStore()
+        self.entities.register("turn_meter", np.float64)
+        self.entities.register("stats", ActorStats.record_dtype())
+        self._actors = {}  # entity -> actor
 
         self.parties: dict[str, Party] = {}
+        self.player_faction = None
         self.actor_stat_bonuses = {}
         self.actor_status_effects = {}
 
@@ -33,13 +41,41 @@ class Battle:
         self._reset_temp_stats()
 
     def add_party(self, party: Party):
+        """Add a party, assigning it the next faction index."""
+        if party.name in self.parties:
+            party.set_faction(self.parties[party.name].faction)
+        else:
+            party.set_faction(len(self.parties))
         self.parties[party.name] = party
+        if party.name == "Player":
+            self.player_faction = party.faction
+
+    @property
+    def turn_meter(self):
+        """The turn meter of every actor, the lowest acts next."""
+        return {
+            actor: float(self.entities.get(entity, "turn_meter"))
+            for entity, actor in self._actors.items()
+        }
 
     def _initialize_turn_meter(self):
-        for actor in self._list_actors(by=None):
-            self.turn_meter[actor] = (
-                GameSettings.BASE_TURN_METER - actor.total_stats.speed
-            )
+        if self._actors:
+            self.entities.despawn(list(self._actors))
+        actors = self._list_actors(by=None)
+        stats = np.array(
+            [actor.total_stats.record() for actor in actors], ActorStats.record_dtype()
+        )
+        entities = self.entities.spawn(
+            len(actors),
+            turn_meter=GameSettings.BASE_TURN_METER - stats["speed"],
+            stats=stats,
+        )
+        self._actors = dict(zip(entities.tolist(), actors))
+
+    def _sync_stats(self):
+        """Copy the actors' total stats, which actions change, into the store."""
+        for entity, actor in self._actors.items():
+            self.entities.set(entity, "stats", actor.total_stats.record())
 
     def _reset_temp_stats(self):
         for actor in self._list_actors(by=None):
@@ -56,21 +92,22 @@ class Battle:
             return sorted(all_actors, key=lambda x: x.total_stats[by])
 
     def _next_actor(self):
-        ready_actor = min(self.turn_meter, key=self.turn_meter.get)
-        self.turn_meter[ready_actor] = (
-            GameSettings.BASE_TURN_METER - ready_actor.total_stats.speed
-        )
-        return ready_actor
+        # the actors all have the same components, so they share one table
+        entities, (meters, stats) = next(self.entities.query("turn_meter", "stats"))
+        row = int(np.argmin(meters))
+        meters[row] = GameSettings.BASE_TURN_METER - stats["speed"][row]
+        return self._actors[int(entities[row])]
 
     def _next_turn(self):
         self.turn += 1
+        self._sync_stats()
         self._tick_down_turn_meter()
         return self._next_actor()
 
     def _tick_down_turn_meter(self):
-        for actor, meter in self.turn_meter.items():
-            self.turn_meter[actor] = max(
-                0, meter - actor.total_stats.dexterity * GameSettings.DEX_SCALE
+        for _, (meters, stats) in self.entities.query("turn_meter", "stats"):
+            np.maximum(
+                meters - stats["dexterity"] * GameSettings.DEX_SCALE, 0, out=meters
             )
 
     def pretty_print_battle(self):
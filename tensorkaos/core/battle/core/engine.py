@@ -44,7 +44,9 @@ class BattleEngine:
 
     @property
     def is_player_turn(self):
-        return self.active_actor in self.battle.parties["Player"]
+        if self.battle.player_faction is None:
+            return False
+        return self.active_actor.faction == self.battle.player_faction
 
     def set_battle(self, battle: Battle):
         self.battle = battle
@@ -60,7 +62,7 @@ class BattleEngine:
             targets.extend(self.active_actor.party.actors)
         if action.can_target_enemies:
             for party in self.battle.parties.values():
-                if self.active_actor.party is not party:
+                if party.faction != self.active_actor.faction:
                     targets.extend(party.actors)
         return targets
 
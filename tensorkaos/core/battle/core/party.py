@@ -4,20 +4,47 @@ from .actor import Actor, ActorStats
 
 
 class Party:
-    """A party is a group of actors."""
+    """A party is a group of actors.
+
+    Actors are kept in ordered storage alongside an id -> slot map, so membership
+    tests and removals are O(1). Removal swaps the last actor into the freed slot.
+    """
 
     def __init__(self, name: str = None):
         self.name = name
+        self.faction = None
         self.actors = []
+        self._slots = {}
 
     def add_actor(self, actor: Actor):
+        if actor.id in self._slots:
+            return
         actor.party = self
+        actor.faction = self.faction
+        self._slots[actor.id] = len(self.actors)
         self.actors.append(actor)
 
     def remove_actor(self, actor: Actor):
-        self.actors.remove(actor)
+        slot = self._slots.pop(actor.id, None)
+        if slot is None:
+            raise ValueError(f"{actor} is not in {self}.")
+
+        last = self.actors.pop()
+        if last is not actor:
+            self.actors[slot] = last
+            self._slots[last.id] = slot
+
+        actor.party = None
+        actor.faction = None
+
+    def set_faction(self, faction: int):
+        """Set the faction index of this party and cache it on every member."""
+        self.faction = faction
+        for actor in self.actors:
+            actor.faction = faction
 
     def __iter__(self):
+        # removal swaps actors around, iterate over list(party) to remove mid-iteration
         return iter(self.actors)
 
     def __len__(self):
@@ -27,7 +54,8 @@ class Party:
         return self.actors[index]
 
     def __contains__(self, actor):
-        return actor in self.actors
+        slot = self._slots.get(getattr(actor, "id", None))
+        return slot is not None and self.actors[slot] is actor
 
     def __repr__(self):
         return f"<Party: {self.actors}>"
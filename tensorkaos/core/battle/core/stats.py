@@ -1,5 +1,7 @@
 from dataclasses import dataclass, field
 
+import numpy as np
+
 
 @dataclass
 class ActorStats:
@@ -36,6 +38,23 @@ class ActorStats:
         zeroed.update(kwargs)
         return cls(**zeroed)
 
+    @classmethod
+    def record_dtype(cls):
+        """A numpy record of the stats, for storing many in one array."""
+        types = {int: np.int32, float: np.float32}
+        return np.dtype(
+            [(k, types[cls.__dataclass_fields__[k].type]) for k in cls.__annotations__]
+        )
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(**{k: record[k].item() for k in cls.__annotations__})
+
+    def record(self):
+        return np.array(
+            tuple(getattr(self, k) for k in self.__annotations__), self.record_dtype()
+        )[()]
+
     @property
     def zeroed(self):
         return self.zero()
@@ -1,33 +1,231 @@
-import numpy as np
+""" Swarm simulations driving sprite lists, synced in bulk.
+
+A `SpriteList` keeps the position and angle of every sprite in flat float arrays, one slot
+per sprite, and uploads them to the GPU when they are flagged as changed. `SpriteSync`
+writes a whole step of a swarm backend into those arrays with a few numpy operations,
+instead of setting `center_x`, `center_y` and `angle` sprite by sprite, so the Python work
+per frame doesn't grow with the number of entities.
+
+The sprites' own attributes are left as they were, only what is drawn moves, so anything
+reading `sprite.position`, e.g. collision checks, should read the swarm's arrays instead.
+
+`ComputeEntityManager` steps swarms on a fixed timestep and draws them interpolated.
+"""
+
 import arcade
+import numpy as np
+
+from .timestep import FixedTimestep
+
+
+class SpriteSync:
+    """Writes into the buffer slots of all of `sprites`, or of the given `slots`."""
+
+    def __init__(self, sprites, slots=None):
+        self.sprites = sprites
+        self._fixed = slots is not None
+        self._slots = slots
+
+    @property
+    def slots(self):
+        """The buffer slot of every sprite, in list order, a slice when they are in order."""
+        if self._fixed:
+            return self._slots
+        # sprites keep their slot until removed, so only look again when the length changes
+        if self._slots is None or self._slot_count != len(self.sprites):
+            slot = self.sprites.sprite_slot
+            slots = np.fromiter(
+                (slot[sprite] for sprite in self.sprites), np.int64, len(self.sprites)
+            )
+            if np.array_equal(slots, np.arange(len(slots))):
+                slots = slice(0, len(slots))
+            self._slots, self._slot_count = slots, len(self.sprites)
+        return self._slots
+
+    def refresh(self):
+        """Forget the slots, after sprites were removed and others added in their place."""
+        if not self._fixed:
+            self._slots = None
+
+    def write(self, positions, angles=None):
+        """Move the sprites to (n, 2) positions and turn them to n angles in radians."""
+        slots = self.slots
+        # views on the sprite list's arrays, released before it could grow them
+        data = np.frombuffer(self.sprites._sprite_pos_data, dtype=np.float32)
+        data.reshape(-1, 2)[slots] = positions
+        self.sprites._sprite_pos_changed = True
+        if angles is not None:
+            data = np.frombuffer(self.sprites._sprite_angle_data, dtype=np.float32)
+            data[slots] = np.degrees(angles)
+            self.sprites._sprite_angle_changed = True
+
+
+class EntityGroup:
+    """A swarm, the sprites it moves and its previous state, to draw in between from.
+
+    `tiers`, an `UpdateTiers`, if given, rebalances how often the swarm's boids steer.
+    `slots` are the sprites' buffer slots, when the swarm only moves some of the list's
+    sprites, e.g. those an `EntityPool` handed out.
+    """
+
+    def __init__(self, swarm, sprites, tiers=None, slots=None):
+        self.swarm = swarm
+        self.sprites = sprites
+        self.tiers = tiers
+        self.slots = slots
+        self.sync = SpriteSync(sprites, slots)
+        self.previous_positions = swarm.positions.copy()
+        self.previous_angles = swarm.angles.copy()
+
+    def remember(self):
+        """Keep the current state as the previous one, before stepping past it."""
+        np.copyto(self.previous_positions, self.swarm.positions)
+        np.copyto(self.previous_angles, self.swarm.angles)
+
+    def show(self, alpha):
+        """Move the sprites `alpha` of the way from the previous state to the current."""
+        positions, angles = self.swarm.positions, self.swarm.angles
+        turn = (angles - self.previous_angles + np.pi) % (2 * np.pi) - np.pi
+        self.sync.write(
+            self.previous_positions + (positions - self.previous_positions) * alpha,
+            self.previous_angles + turn * alpha,
+        )
+
+
+class ComputeEntityManager:
+    """Named groups of a swarm backend and the sprites it moves.
+
+    Swarms advance in fixed steps, as many as the frame times add up to, and the sprites are
+    drawn interpolated between the last two states.
+
+    When `pipelined`, each step shows the step started by the previous one and starts the
+    next, which runs while the frame is drawn: the sprites trail the simulation by a step,
+    and a frame costs about the longer of the step and the drawing rather than their sum.
+    """
+
+    def __init__(self, pipelined=True, timestep=None):
+        self.groups = {}
+        self.pipelined = pipelined
+        self.timestep = FixedTimestep() if timestep is None else timestep
+
+    def add_group(self, name, swarm, sprites, tiers=None, slots=None):
+        self.groups[name] = EntityGroup(swarm, sprites, tiers, slots)
+        self.groups[name].show(1.0)
+
+    def reset_group(self, name, positions, angles):
+        """Start a group's swarm over from new state, reusing its arrays and sprites."""
+        group = self.groups[name]
+        group.swarm.reset(positions, angles)
+        group.remember()
+        group.show(1.0)
+
+    def remove_group(self, name):
+        group = self.groups.pop(name)
+        group.swarm.close()
+        return group
+
+    def update(self, delta_time, target, view=None):
+        """Step the swarms towards `target`, `view` is the visible (l, b, r, t) rectangle."""
+        steps = self.timestep.advance(delta_time)
+        for group in self.groups.values():
+            swarm = group.swarm
+            for index in range(steps):
+                if index == steps - 1:
+                    group.remember()
+                swarm.wait()
+                if group.tiers is not None:
+                    group.tiers.update(swarm, target, view)
+                if self.pipelined:
+                    swarm.step_async(self.timestep.step, target)
+                else:
+                    swarm.step(self.timestep.step, target)
+            group.show(self.timestep.alpha)
+
+    def draw(self):
+        # groups can share a sprite list, draw each once
+        for sprites in {
+            id(group.sprites): group.sprites for group in self.groups.values()
+        }.values():
+            sprites.draw()
+
+    def close(self):
+        for name in list(self.groups):
+            self.remove_group(name)
+
+
+def make_sprites(texture, count, scale=1.0, sprite_type=arcade.Sprite, **kwargs):
+    """A sprite list of `count` sprites sharing one texture, sized for them up front."""
+    sprites = arcade.SpriteList(capacity=max(count, 1))
+    sprites.extend(
+        [sprite_type(texture=texture, scale=scale, **kwargs) for _ in range(count)]
+    )
+    return sprites
+
+
+if __name__ == "__main__":
+    import time
+
+    from ..swarm.cpu import CpuSwarm
+
+    # benchmark, syncing a swarm step into a sprite list in bulk against sprite by sprite
+    window = arcade.Window(100, 100, visible=False)
+    rng = np.random.default_rng(0)
+    texture = arcade.make_circle_texture(4, arcade.color.WHITE)
+    for size in (1_000, 10_000, 100_000):
+        swarm = CpuSwarm(
+            rng.uniform(0, 1000, (size, 2)), rng.uniform(-np.pi, np.pi, size)
+        )
+        sprites = make_sprites(texture, size)
+        sync = SpriteSync(sprites)
+        sync.write(swarm.positions, swarm.angles)
+
+        start = time.perf_counter()
+        for _ in range(10):
+            sync.write(swarm.positions, swarm.angles)
+        bulk = (time.perf_counter() - start) / 10
+
+        start = time.perf_counter()
+        angles = np.degrees(swarm.angles).tolist()
+        for sprite, (x, y), angle in zip(sprites, swarm.positions.tolist(), angles):
+            sprite.center_x, sprite.center_y = x, y
+            sprite.angle = angle
+        loop = time.perf_counter() - start
+        print(
+            f"{size:>7} sprites: synced in bulk in {bulk * 1000:7.3f}ms,"
+            f" one by one in {loop * 1000:8.2f}ms"
+        )
+
+    # the bulk path draws the same as setting every sprite
+    sprites.draw()
+    data = np.frombuffer(sprites._sprite_pos_data, dtype=np.float32)
+    assert np.allclose(data[: 2 * size].reshape(-1, 2), swarm.positions)
+    print("Sprites set one by one hold the positions written in bulk.")
+
+    # frame times, stepping then drawing against drawing while the next step runs
+    from ..swarm.backend import create_swarm
 
-class ComputeShaderManager:
-    def __init__(self, context, shader_source):
-        self.context = context
-        self.shader = context.compute_shader(shader_source)
-        self.sprite_groups = {}
-        self.buffers = {}
-
-    def add_sprite_group(self, name, sprites):
-        self.sprite_groups[name] = sprites
-        # Assume each sprite has a position stored as (x, y)
-        positions = np.array([(s.center_x, s.center_y) for s in sprites], dtype=np.float32)
-        # Create SSBO and store it in buffers dictionary
-        self.buffers[name] = self.context.buffer(data=positions.tobytes())
-
-    def update_sprites(self):
-        for name, sprites in self.sprite_groups.items():
-            buffer = self.buffers[name]
-            # Update buffer data if necessary, e.g., sprites moved
-            self.shader['positions'] = buffer
-            # Run the shader
-            self.shader.run(group_x=len(sprites) // 16 + 1)
-            # Read back updated positions
-            new_positions = np.frombuffer(buffer.read(), dtype=np.float32).reshape(-1, 2)
-            for sprite, (x, y) in zip(sprites, new_positions):
-                sprite.center_x, sprite.center_y = x, y
-
-# Example of setting up the manager and adding a group of sprites
-context = arcade.get_window().ctx
-manager = ComputeShaderManager(context, "path/to/shader.glsl")
-manager.add_sprite_group("enemies", enemy_sprites)
+    window.set_size(1280, 720)
+    size = 50_000
+    positions = rng.uniform(0, (1280, 720), (size, 2))
+    angles = rng.uniform(-np.pi, np.pi, size)
+    for backend in ("cpu", "gpu"):
+        for pipelined in (False, True):
+            manager = ComputeEntityManager(pipelined)
+            manager.add_group(
+                "boids",
+                create_swarm(positions, angles, ctx=window.ctx, backend=backend),
+                make_sprites(texture, size),
+            )
+            times = []
+            for frame in range(40):
+                start = time.perf_counter()
+                window.clear()
+                manager.update(1 / 60, (640, 360))
+                manager.draw()
+                window.ctx.finish()
+                times.append(time.perf_counter() - start)
+            manager.close()
+            print(
+                f"{backend}, {'pipelined' if pipelined else 'serial':>9}:"
+                f" {np.median(times[5:]) * 1000:6.2f}ms per frame for {size} boids"
+            )
@@ -0,0 +1,191 @@
+""" A pool of sprites made once and recycled, drawn from one texture atlas.
+
+The pool's sprite list holds `capacity` sprites from the start. Free ones stay in it, hidden
+by a zero alpha which the sprite shader discards, and their slots are kept in a sorted free
+array. Acquiring entities is a slice off its front, releasing them a merge back into it, and
+either is a column write to the list's color data; no sprites are created or removed, so the
+list never reallocates its buffers unless the pool has to grow.
+
+Sprites are never removed from the list, so the index of a sprite is also its buffer slot,
+and the slots handed out can be given straight to `SpriteSync`. The lowest free slots are
+handed out first, which keeps the slots in use packed at the front of the list, and the list
+only draws up to the last of them, see `PooledSpriteList`, so a pool much bigger than what is
+in use costs nothing to draw.
+
+Every texture the pool's entities can wear is packed into one atlas up front, see
+`pack_atlas`, which pools can share, so a draw binds a single texture.
+"""
+
+import arcade
+import numpy as np
+
+from ...utilities.misc import setup_logging
+
+log = setup_logging(__name__)
+
+
+def pack_atlas(textures, size=(256, 256), ctx=None):
+    """A texture atlas holding `textures`, growing past `size` if they don't fit."""
+    return arcade.TextureAtlas(size, textures=list(textures), ctx=ctx)
+
+
+class PooledSpriteList(arcade.SpriteList):
+    """A sprite list which only draws its first `drawn` sprites."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drawn = 0
+
+    def draw(self, **kwargs):
+        if not self.drawn:
+            return
+        # the buffers are written whole, only the number of points drawn changes
+        count = self._sprite_index_slots
+        self._sprite_index_slots = min(self.drawn, count)
+        try:
+            super().draw(**kwargs)
+        finally:
+            self._sprite_index_slots = count
+
+
+class EntityPool:
+    def __init__(
+        self,
+        textures,
+        capacity,
+        scale=1.0,
+        sprite_type=arcade.Sprite,
+        atlas=None,
+        **kwargs,
+    ):
+        self.textures = list(textures)
+        self.scale = scale
+        self.sprite_type = sprite_type
+        self.kwargs = kwargs
+        self.atlas = pack_atlas(self.textures) if atlas is None else atlas
+        self.sprites = PooledSpriteList(capacity=max(capacity, 1), atlas=self.atlas)
+        self.capacity = 0
+        self._free = np.empty(0, dtype=np.int64)  # free slots, lowest first
+        self._active = np.zeros(0, dtype=bool)
+        self._grow(capacity)
+
+    def __len__(self):
+        """The number of entities in use."""
+        return self.capacity - len(self._free)
+
+    def _grow(self, capacity):
+        added = capacity - self.capacity
+        if added <= 0:
+            return
+        self.sprites.extend(
+            [
+                self.sprite_type(
+                    texture=self.textures[0], scale=self.scale, **self.kwargs
+                )
+                for _ in range(added)
+            ]
+        )
+        # the new slots are above every free one, so the free slots stay sorted
+        self._free = np.concatenate((self._free, np.arange(self.capacity, capacity)))
+        self._active = np.concatenate((self._active, np.zeros(added, dtype=bool)))
+        self.capacity = capacity
+        self._set_alpha(np.arange(capacity - added, capacity), 0)
+
+    def acquire(self, count, texture=None):
+        """Slots of `count` hidden entities made visible, the pool doubles when it runs out.
+
+        `texture`, one of the pool's textures by index, is worn by the acquired entities.
+        """
+        if count > len(self._free):
+            new_capacity = max(2 * self.capacity, len(self) + count)
+            log.debug(f"Growing a pool of {self.capacity} entities to {new_capacity}")
+            self._grow(new_capacity)
+        slots, self._free = self._free[:count].copy(), self._free[count:]
+        self._active[slots] = True
+        if len(slots):
+            self.sprites.drawn = max(self.sprites.drawn, int(slots.max()) + 1)
+        if texture is not None:
+            texture = self.textures[texture]
+            for slot in slots:
+                sprite = self.sprites[slot]
+                if sprite.texture is not texture:
+                    sprite.texture = texture
+        self._set_alpha(slots, 255)
+        return slots
+
+    def release(self, slots):
+        """Hide the entities in `slots` and put them back on the free list."""
+        # a slot listed twice is released once
+        slots = np.unique(np.asarray(slots, dtype=np.int64))
+        if not np.all(self._active[slots]):
+            raise ValueError("Releasing entities which are not in use.")
+        self._active[slots] = False
+        self._free = np.insert(self._free, np.searchsorted(self._free, slots), slots)
+        self._set_alpha(slots, 0)
+        # draw up to the last slot still in use
+        active = np.flatnonzero(self._active[: self.sprites.drawn])
+        self.sprites.drawn = int(active[-1]) + 1 if len(active) else 0
+
+    def release_all(self):
+        self.release(np.flatnonzero(self._active))
+
+    def _set_alpha(self, slots, alpha):
+        colors = np.frombuffer(self.sprites._sprite_color_data, dtype=np.uint8)
+        colors.reshape(-1, 4)[slots, 3] = alpha
+        self.sprites._sprite_color_changed = True
+
+    def draw(self):
+        self.sprites.draw()
+
+
+if __name__ == "__main__":
+    import time
+
+    # benchmark, a restart of 100 entities by recycling them against making new sprites
+    window = arcade.Window(100, 100, visible=False)
+    textures = [
+        arcade.load_texture(":resources:images/enemies/slimeBlue.png"),
+        arcade.load_texture(":resources:images/enemies/slimeGreen.png"),
+    ]
+    pool = EntityPool(textures, 1000, 0.1)
+    slots = pool.acquire(100)
+    start = time.perf_counter()
+    for _ in range(100):
+        pool.release(slots)
+        slots = pool.acquire(100)
+    recycled = (time.perf_counter() - start) / 100
+
+    start = time.perf_counter()
+    for _ in range(100):
+        sprites = arcade.SpriteList()
+        sprites.extend(
+            [arcade.Sprite(texture=textures[0], scale=0.1) for _ in range(100)]
+        )
+    made = (time.perf_counter() - start) / 100
+    print(
+        f"Restarting 100 entities: recycled in {recycled * 1000:.3f}ms,"
+        f" made anew in {made * 1000:.3f}ms"
+    )
+
+    # slots come back, only what is in use is drawn, and the pool grows when it runs out
+    pool.release(slots)
+    assert len(pool) == 0 and pool.sprites.drawn == 0
+    assert np.array_equal(np.sort(pool.acquire(100)), slots)
+    assert pool.sprites.drawn == 100
+    pool.release(slots[slots < 50])
+    assert pool.sprites.drawn == 100 and np.all(pool.acquire(10) < 50)
+    pool.release(np.flatnonzero(pool._active[50:]) + 50)
+    assert pool.sprites.drawn == 10
+    pool.release([2, 2, 9])
+    assert len(pool) == 8 and np.array_equal(pool.acquire(2), [2, 9])
+    pool.release_all()
+    slots = pool.acquire(1500, texture=1)
+    assert pool.capacity == 2000 and len(set(slots.tolist())) == 1500
+    colors = np.frombuffer(pool.sprites._sprite_color_data, dtype=np.uint8)
+    alpha = colors.reshape(-1, 4)[: pool.capacity, 3]
+    assert np.array_equal(np.flatnonzero(alpha), np.sort(slots))
+    slot = pool.sprites.sprite_slot
+    assert all(slot[pool.sprites[index]] == index for index in range(pool.capacity))
+    assert pool.atlas.has_texture(textures[1]) and pool.sprites.atlas is pool.atlas
+    pool.draw()
+    print("Pools recycle their slots, hide what is free and grow on demand.")
@@ -0,0 +1,90 @@
+""" A fixed simulation timestep, decoupled from the rate frames are drawn at.
+
+Frame times are added to an accumulator which is spent in whole simulation steps, zero or
+more per frame, so the simulation advances the same way at 30 or 300 frames per second.
+What is left over, as a fraction of a step, is how far to interpolate between the last two
+states when drawing. A frame is never given more than `max_steps` steps: when the
+simulation can't keep up, time is dropped instead of piling up ever more steps per frame.
+
+`run_headless` steps swarms as fast as they go, without drawing, for benchmarks.
+"""
+
+import time
+
+
+class FixedTimestep:
+    def __init__(self, step=1 / 60, max_steps=5):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.steps = 0  # Simulation steps taken so far
+        self.dropped = 0.0  # Seconds skipped to stay within max_steps
+
+    @property
+    def alpha(self):
+        """How far the current time is between the last two states, in [0, 1)."""
+        return self.accumulator / self.step
+
+    def advance(self, delta_time):
+        """Add a frame's time, returns the number of simulation steps it pays for."""
+        self.accumulator += delta_time
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            self.dropped += (steps - self.max_steps) * self.step
+            self.accumulator -= (steps - self.max_steps) * self.step
+            steps = self.max_steps
+        self.accumulator -= steps * self.step
+        self.steps += steps
+        return steps
+
+
+def run_headless(swarms, target, steps, step=1 / 60, pipelined=True):
+    """Step swarms `steps` times without drawing, returns the steps per second."""
+    start = time.perf_counter()
+    for _ in range(steps):
+        for swarm in swarms:
+            if pipelined:
+                swarm.wait()
+                swarm.step_async(step, target)
+            else:
+                swarm.step(step, target)
+    for swarm in swarms:
+        swarm.wait()
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    import arcade
+    import numpy as np
+
+    from ..swarm.backend import create_swarm
+
+    # headless runs at growing swarm sizes, with about 10 neighbors per boid
+    window = arcade.Window(100, 100, visible=False)
+    rng = np.random.default_rng(0)
+    for backend in ("cpu", "gpu"):
+        for size in (10_000, 100_000, 1_000_000):
+            side = np.sqrt(size * np.pi * 40.0**2 / 10)
+            swarm = create_swarm(
+                rng.uniform(0, side, (size, 2)),
+                rng.uniform(-np.pi, np.pi, size),
+                ctx=window.ctx,
+                backend=backend,
+            )
+            run_headless([swarm], (side / 2, side / 2), 1)
+            rate = run_headless([swarm], (side / 2, side / 2), max(3, 300_000 // size))
+            print(
+                f"{backend} {size:>9} boids: {rate:8.1f} steps per second,"
+                f" {rate / 60:6.2f}x real time at 60 steps per second"
+            )
+            swarm.close()
+
+    # frame rates don't change where the simulation gets to
+    for fps in (30, 60, 144):
+        timestep = FixedTimestep()
+        for _ in range(fps):
+            timestep.advance(1 / fps)
+        assert abs(timestep.steps + timestep.alpha - 60) < 1e-6
+    timestep = FixedTimestep(max_steps=5)
+    assert timestep.advance(1.0) == 5 and abs(timestep.dropped - 55 / 60) < 1e-6
+    print("A second is 60 steps at any frame rate, a stalled frame gets at most 5.")
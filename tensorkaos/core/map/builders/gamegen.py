@@ -1,19 +1,26 @@
-import networkx as nx
-import random
-
 from ..module import GraphModule
 
 
 class GameGraph(GraphModule):
-    module_counter = 0  # Class variable to keep track of the number of modules created
+    # compiled module templates by kind, see `template`
+    TEMPLATES = {}
+
+    @classmethod
+    def template(cls, kind):
+        """The module of a kind, e.g. "c_loop", built by its `create_` method only once.
 
-    def new_unique_id(self):
-        """Generate a new unique ID for a module."""
-        unique_id = self.module_counter
-        self.module_counter += 1
-        return unique_id
+        Templates are shared and must not be edited, `integrate_module(s)` only reads them.
+        """
+        template = cls.TEMPLATES.get(kind)
+        if template is None:
+            template = getattr(cls, f"create_{kind}")()
+            # compile the adjacency once, instancing only reads the edge arrays
+            template.edge_arrays()
+            cls.TEMPLATES[kind] = template
+        return template
 
-    def create_dead_end(self):
+    @staticmethod
+    def create_dead_end():
         dead_end = GraphModule()
         entry = dead_end.add_positioned_module_node(f"Entry", (0, 0))
         one_dead = dead_end.add_positioned_module_node(f"DeadEnd", (1, 0))
@@ -22,7 +29,8 @@ class GameGraph(GraphModule):
         dead_end.set_entry_exit(entry, entry)
         return dead_end
 
-    def create_broken_trident(self):
+    @staticmethod
+    def create_broken_trident():
         trident = GraphModule()
         base = trident.add_positioned_module_node("Base", (0, 0))
         left_arm = trident.add_positioned_module_node("LeftArm", (2, 1))
@@ -43,7 +51,8 @@ class GameGraph(GraphModule):
 
         return trident
 
-    def create_c_loop(self):
+    @staticmethod
+    def create_c_loop():
         c_loop = GraphModule()
         entry = c_loop.add_positioned_module_node("Entry", (0, 0))
         loop_start = c_loop.add_positioned_module_node("LoopStart", (1, 0))
@@ -1,4 +1,6 @@
 from .gamegen import GameGraph
+from .helpers import complicate_map
+from ..layout import force_layout
 
 
 def generate_base_complex():
@@ -8,32 +10,43 @@ def generate_base_complex():
     # Basic setup - Add core nodes
     core_nodes = ["Start", "Mid", "End"]
     positions = [(0, 0), (3, 0), (6, 0)]  # Example positions
-    for node, pos in zip(core_nodes, positions):
-        game_graph.add_node(node, attr={"position": pos})
+    start, mid, end = [
+        game_graph.add_node(node, pos) for node, pos in zip(core_nodes, positions)
+    ]
 
-    game_graph.add_edges_from([("Start", "Mid"), ("Mid", "End")])
-    game_graph.set_entry_exit("Start", "End")
+    game_graph.add_edges_from([(start, mid), (mid, end)])
+    game_graph.set_entry_exit(start, end)
 
     # Integrate more complex structures
-    c_loop = game_graph.create_c_loop()
-    game_graph.integrate_module("Start", c_loop)
-    broken_trident = game_graph.create_broken_trident()
-    game_graph.integrate_module("Mid", broken_trident)
-    dead_end = game_graph.create_dead_end()
-    game_graph.integrate_module("End", dead_end)
+    game_graph.integrate_module(start, game_graph.template("c_loop"))
+    game_graph.integrate_module(mid, game_graph.template("broken_trident"))
+    game_graph.integrate_module(end, game_graph.template("dead_end"))
 
     return game_graph
 
 
+def generate_map(seed, layout=False):
+    """Generate the full game map for a seed, the same map every time.
+
+    With `layout` the node positions are also relaxed with a force directed layout.
+    """
+    map = complicate_map(generate_base_complex(), seed)
+    if layout:
+        force_layout(map)
+    return map
+
+
 if __name__ == "__main__":
+    import networkx as nx
+
     graph = generate_base_complex()
-    print(graph.nodes(data=True))
-    print(graph.edges(data=True))
+    print(graph.to_networkx().nodes(data=True))
+    print(graph.to_networkx().edges())
     print(graph.entry_node, graph.exit_node)
     print("Graph generation successful.")
 
     # plot the graph
     import matplotlib.pyplot as plt
 
-    nx.draw(graph, with_labels=True)
+    nx.draw(graph.to_networkx(), with_labels=True)
     plt.show()
@@ -1,11 +1,14 @@
 import random
-import networkx as nx
+import numpy as np
 
+from ..search import condensation, edge_condensation, match_sources_to_sinks
+from .lazy import mark_stub
 
-def finalize_entry_exit(map, default_entry="Start_", default_exit="End_"):
-    """Finalize the entry and exit nodes for the map."""
-    entry = random.choice([n for n in map.nodes() if n.startswith(default_entry)])
-    exit = random.choice([n for n in map.nodes() if n.startswith(default_exit)])
+
+def finalize_entry_exit(map, rng):
+    """Finalize the entry and exit nodes for the map, picking them from the modules that replaced them."""
+    entry = rng.choice(map.module_nodes(map.module_ids[map.entry_node]).tolist())
+    exit = rng.choice(map.module_nodes(map.module_ids[map.exit_node]).tolist())
     map.entry_node = entry
     map.exit_node = exit
     return map
@@ -13,62 +16,126 @@ def finalize_entry_exit(map, default_entry="Start_", default_exit="End_"):
 
 # TODO: need to fix map node positions so they're offset properly
 # TODO: these need to properly assume the entry/exit node labels so that we can reference them easily in the final map
-def replace_nodes(map):
-    """Iteratively replace nodes in a complex map with modules."""
-    for node in list(map.nodes()):
-        if map.degree(node) == 1:
-            c_loop = map.create_c_loop()
-            map.integrate_module(node, c_loop)
-        elif map.degree(node) == 2:
-            # make a recursive trident by making a broken trident of broken tridents
-            broken_trident = map.create_broken_trident()
-            # for each node of the broken trident, integrate a broken trident
-            # TODO: crashing here
-            # for n in list(broken_trident.nodes()):
-            #    broken_trident.replace_node_with_module(n, map.create_broken_trident())
-            map.integrate_module(node, broken_trident)
-        elif map.degree(node) == 3:
-            broken_trident = map.create_broken_trident()
-            map.integrate_module(node, broken_trident)
-        elif map.degree(node) == 4:
-            # go to each neighbor and create a dead end
-            neighbors = list(map.neighbors(node))
-            for neighbor in neighbors:
-                dead_end = map.create_dead_end()
-                map.integrate_module(neighbor, dead_end)
-    return map
+def replace_nodes(map, rng):
+    """Replace the nodes of a complex map with modules, chosen by their degree.
+
+    Nodes of the same degree are spliced in one pass with `integrate_modules`.
+    """
+    degrees = map.degree()
+    nodes = np.arange(len(map), dtype=np.int32)
+
+    map.integrate_modules(nodes[degrees == 1], map.template("c_loop"))
 
+    # make a recursive trident by making a broken trident of broken tridents
+    broken_trident = map.template("broken_trident")
+    ids = map.integrate_modules(nodes[degrees == 2], broken_trident)
+    # each other node of the broken trident is a broken trident stub, expanded lazily
+    for n in ids[
+        :, np.arange(len(broken_trident)) != broken_trident.entry_node
+    ].ravel():
+        mark_stub(map, n, "broken_trident", rng.getrandbits(64), depth=1)
 
-def loopback_deadends(map):
-    """If a map has no outgoing edges, loop it back to an "earlier" node in the path, closer to the entry node."""
-    for node in list(map.nodes()):
-        if map.out_degree(node) == 0:
-            for n in list(map.nodes()):
-                if map.in_degree(n) > 0 or map.out_degree(n) < 2:
-                    map.add_edge(node, n)
-                    break
+    map.integrate_modules(nodes[degrees == 3], broken_trident)
+
+    # go to each neighbor and create a dead end
+    for node in nodes[degrees == 4].tolist():
+        map.integrate_modules(map.neighbors(node).copy(), map.template("dead_end"))
     return map
 
 
-def connect_unreachable_nodes(map):
-    """Connect nodes that are unreachable from the entry node."""
-    print(f"Entry node: {map.entry_node}, Exit node: {map.exit_node}")
-    reachable = nx.descendants(map, map.entry_node)
-    reachable.add(map.entry_node)
-    unreachable = set(map.nodes) - reachable
-    reachable = list(reachable)
+def repair_connectivity(map):
+    """Make every node reachable from the entry node and the exit node reachable from every node.
+
+    That is the same as making the map plus an edge from the exit to the entry strongly
+    connected, which takes max(sources, sinks) new edges in the condensation of that graph,
+    and no fewer. Following Eswaran and Tarjan, sources are matched to distinct sinks they
+    reach and the matched pairs chained into a cycle. Every unmatched sink then leads to an
+    unmatched source, and whichever are left over are joined to the cycle. All in O(V+E).
+    """
+    component, count, source, target = condensation(map)
+    entry, exit = component[map.entry_node], component[map.exit_node]
+    merged, count, source, target = edge_condensation(
+        np.append(source, exit), np.append(target, entry), count
+    )
+    if count == 1:
+        return map
+    component = merged[component]
+    sources, sinks, matched = match_sources_to_sinks(source, target, count)
 
-    if unreachable:
-        for node in unreachable:
-            if random.random() < 0.75:
-                # TODO: reachable can be empty, fix
-                map.add_edge(random.choice(reachable), node)
+    # one node per component to attach the new edges to
+    representative = np.empty(count, dtype=np.int32)
+    representative[component] = np.arange(len(map), dtype=np.int32)
+
+    paired = min(len(sources), len(sinks))
+    new_sources = np.concatenate(
+        (
+            sinks[:matched],
+            sinks[matched:paired],
+            sinks[paired:],
+            np.full(len(sources) - paired, sinks[0], dtype=np.int32),
+        )
+    )
+    new_targets = np.concatenate(
+        (
+            np.roll(sources[:matched], -1),
+            sources[matched:paired],
+            np.full(len(sinks) - paired, sources[0], dtype=np.int32),
+            sources[paired:],
+        )
+    )
+    map.add_edges(representative[new_sources], representative[new_targets])
     return map
 
 
-def complicate_map(graph):
-    replace_nodes(graph)
-    loopback_deadends(graph)
-    finalize_entry_exit(graph, default_entry="Start_", default_exit="End_")
-    connect_unreachable_nodes(graph)
+def complicate_map(graph, seed=None):
+    """Replace the nodes of a base map with modules and repair it.
+
+    Every random choice is drawn from a generator seeded with `seed`, so the same base map and
+    seed always give the same map.
+    """
+    rng = random.Random(seed)
+    replace_nodes(graph, rng)
+    finalize_entry_exit(graph, rng)
+    repair_connectivity(graph)
     return graph
+
+
+if __name__ == "__main__":
+    import time
+
+    from .gamegen import GameGraph
+    from ..search import bfs_distances
+
+    # scale check, repair sparse random maps, and no fewer edges would do: in the condensation
+    # of the map plus an exit -> entry edge, each source needs an edge in and each sink one out
+    rng = np.random.default_rng(0)
+    for size in (10_000, 1_000_000):
+        map = GameGraph(capacity=size)
+        map._allocate_nodes(size)
+        map.positions[:] = rng.uniform(0, 1000, (size, 2))
+        map.add_edges(rng.integers(0, size, size), rng.integers(0, size, size))
+        map.set_entry_exit(0, size - 1)
+
+        component, count, source, target = condensation(map)
+        entry, exit = component[map.entry_node], component[map.exit_node]
+        _, count, source, target = edge_condensation(
+            np.append(source, exit), np.append(target, entry), count
+        )
+        sources = np.count_nonzero(np.bincount(target, minlength=count) == 0)
+        sinks = np.count_nonzero(np.bincount(source, minlength=count) == 0)
+
+        start = time.perf_counter()
+        edges = map.number_of_edges()
+        repair_connectivity(map)
+        added = map.number_of_edges() - edges
+        print(
+            f"Repaired {size} nodes in {time.perf_counter() - start:.2f}s,"
+            f" {added} edges added for {sources} sources and {sinks} sinks"
+        )
+
+        assert added == max(sources, sinks)
+        assert (bfs_distances(map, map.entry_node) >= 0).all()
+        assert (bfs_distances(map, map.exit_node, reverse=True) >= 0).all()
+    print(
+        "Every node is reachable from the entry and reaches the exit, with fewest edges."
+    )
@@ -0,0 +1,115 @@
+""" Lazy, on-demand expansion of module stubs.
+
+A stub is a map node that stands for a module which has not been built yet. Stubs are only
+expanded, through `integrate_modules`, once the player gets within a few hops of them, so the
+cost of a deep or unbounded hierarchy is limited to what has been visited. Every stub carries
+its own seed and child seeds are derived from it, which makes an expansion independent of the
+order in which the player reaches the stubs.
+"""
+
+import random
+import numpy as np
+
+from ....utilities.misc import derive_seed
+
+
+# stub kind k expands into GameGraph.template(MODULE_KINDS[k - 1])
+MODULE_KINDS = ("c_loop", "broken_trident", "dead_end")
+
+
+def mark_stub(map, node, kind, seed, depth=0):
+    """Turn a node into an unexpanded module stub."""
+    map.column("stub_kinds")[node] = MODULE_KINDS.index(kind) + 1
+    map.column("seeds")[node] = seed
+    map.column("depths")[node] = depth
+    map._touch([node])
+
+
+def expand_stub(map, node, stub_chance=0.5, max_depth=None):
+    """Expand a stub into its module, turning some of the new nodes into stubs one level deeper.
+
+    Returns the ids of the module's nodes.
+    """
+    if map.stub_kinds[node] == 0:
+        raise ValueError(f"Node '{map.node_name(node)}' is not a module stub.")
+    return expand_stubs(map, [node], stub_chance, max_depth)[node]
+
+
+def expand_stubs(map, nodes, stub_chance=0.5, max_depth=None):
+    """Expand several stubs at once, splicing all stubs of the same kind in one pass.
+
+    Returns a dict of the ids of each expanded module's nodes, by stub.
+    """
+    nodes = np.asarray(nodes, dtype=np.int32)
+    kinds = map.stub_kinds[nodes].copy()
+    seeds = map.column("seeds")[nodes].copy()
+    depths = map.column("depths")[nodes].copy()
+
+    expanded = {}
+    for kind in np.unique(kinds[kinds > 0]).tolist():
+        of_kind = kinds == kind
+        template = map.template(MODULE_KINDS[kind - 1])
+        ids = map.integrate_modules(nodes[of_kind], template)
+
+        for node, module, seed, depth in zip(
+            nodes[of_kind].tolist(),
+            ids,
+            seeds[of_kind].tolist(),
+            depths[of_kind].tolist(),
+        ):
+            expanded[node] = module
+            nested = max_depth is None or depth + 1 < max_depth
+            if not nested:
+                continue
+            rng = random.Random(seed)
+            for i, child in enumerate(module.tolist()):
+                if child != node and rng.random() < stub_chance:
+                    mark_stub(
+                        map,
+                        child,
+                        rng.choice(MODULE_KINDS),
+                        derive_seed(seed, i),
+                        depth + 1,
+                    )
+
+        # loop dead ends of the new modules back to their entries, the new nodes' degrees
+        # come from their own edges rather than compiling the whole map
+        degrees, _ = map.listed_successors(ids.ravel())
+        dead = (degrees.reshape(ids.shape) == 0) & (ids != map.exit_node)
+        entries = np.broadcast_to(nodes[of_kind][:, None], ids.shape)
+        map.add_edges(ids[dead], entries[dead])
+
+    return expanded
+
+
+def nodes_within(map, node, radius):
+    """The nodes at most `radius` hops from `node`, sorted.
+
+    Walks out from `node` a frontier at a time over the edge lists, so it costs what the
+    neighborhood does, however big the map is and however recently it was edited.
+    """
+    seen = {node}
+    frontier = [node]
+    for _ in range(radius):
+        if not frontier:
+            break
+        _, successors = map.listed_successors(frontier)
+        frontier = set(successors.tolist()) - seen
+        seen |= frontier
+        frontier = list(frontier)
+    return np.sort(np.fromiter(seen, dtype=np.int32, count=len(seen)))
+
+
+def expand_near(map, node, radius, stub_chance=0.5, max_depth=None):
+    """Expand every stub within `radius` hops of a node, until none are left in range.
+
+    Returns the number of stubs expanded.
+    """
+    expanded = 0
+    while True:
+        near = nodes_within(map, node, radius)
+        stubs = near[map.stub_kinds[near] > 0]
+        if not len(stubs):
+            return expanded
+        expand_stubs(map, stubs, stub_chance, max_depth)
+        expanded += len(stubs)
@@ -0,0 +1,148 @@
+""" Quality metrics for generated maps and a parallel search for the best of many candidates.
+
+Candidates are generated from seeds derived from one search seed, so the best map of a search
+is reproduced exactly by regenerating its seed. Worker processes only send back metric
+rows, never maps.
+"""
+
+import os
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .generators import generate_map
+from ..search import bfs
+from ....utilities.misc import derive_seed
+
+
+METRICS = np.dtype(
+    [
+        ("entry_exit_distance", np.float64),
+        ("loops", np.float64),
+        ("dead_end_ratio", np.float64),
+        ("branching_factor", np.float64),
+        ("unreachable", np.float64),
+    ]
+)
+
+# longer, loopier maps with some choice at each node, few dead ends and nothing cut off
+DEFAULT_WEIGHTS = {
+    "entry_exit_distance": 1.0,
+    "loops": 0.5,
+    "dead_end_ratio": -10.0,
+    "branching_factor": 2.0,
+    "unreachable": -100.0,
+}
+
+
+def map_metrics(map):
+    """The quality metrics of a map, as one METRICS row."""
+    indptr, indices = map.csr()
+    reverse_indptr, reverse_indices = map.reverse_csr()
+    out_degree, in_degree = np.diff(indptr), np.diff(reverse_indptr)
+
+    from_entry = bfs(map, map.entry_node)[0]
+    to_exit = bfs(map, map.exit_node, reverse=True)[0]
+
+    # a dead end has nowhere to go but back where it was entered from
+    single = (out_degree == 1) & (in_degree == 1)
+    back = indices[indptr[:-1][single]] == reverse_indices[reverse_indptr[:-1][single]]
+    dead_ends = np.count_nonzero(out_degree == 0) + np.count_nonzero(back)
+
+    metrics = np.zeros((), dtype=METRICS)
+    metrics["entry_exit_distance"] = from_entry[map.exit_node]
+    # independent cycles of a connected graph
+    metrics["loops"] = len(indices) - len(map) + 1
+    metrics["dead_end_ratio"] = dead_ends / len(map)
+    branching = out_degree[out_degree > 0]
+    metrics["branching_factor"] = branching.mean() if len(branching) else 0.0
+    metrics["unreachable"] = np.count_nonzero((from_entry < 0) | (to_exit < 0))
+    return metrics
+
+
+def score(metrics, weights=None):
+    """Score METRICS rows, one score per row."""
+    weights = weights or DEFAULT_WEIGHTS
+    columns = list(weights)
+    table = np.stack([np.atleast_1d(metrics[name]) for name in columns], axis=-1)
+    return table @ np.array([weights[name] for name in columns])
+
+
+def candidate_seeds(seed, count):
+    return np.array([derive_seed(seed, i) for i in range(count)], dtype=np.uint64)
+
+
+def _candidate_metrics(generate, seeds, params):
+    return np.array(
+        [map_metrics(generate(int(seed), **params)) for seed in seeds], dtype=METRICS
+    )
+
+
+def search_maps(
+    seed,
+    count,
+    generate=generate_map,
+    weights=None,
+    workers=None,
+    **params,
+):
+    """Generate `count` candidate maps and pick the best scoring one.
+
+    Candidates are spread over `workers` processes, all cores by default, or generated here
+    with `workers=0`. Returns (best seed, best map, seeds, metrics) where the last two hold
+    every candidate, so the metric distribution can be inspected.
+    """
+    if count < 1:
+        raise ValueError(f"Searching needs at least one candidate map, not {count}.")
+    seeds = candidate_seeds(seed, count)
+    if workers == 0:
+        metrics = _candidate_metrics(generate, seeds, params)
+    else:
+        workers = workers or os.cpu_count()
+        batches = np.array_split(seeds, min(workers * 4, count))
+        with ProcessPoolExecutor(workers) as executor:
+            results = executor.map(
+                _candidate_metrics,
+                [generate] * len(batches),
+                batches,
+                [params] * len(batches),
+            )
+            metrics = np.concatenate(list(results))
+
+    best = int(seeds[np.argmax(score(metrics, weights))])
+    return best, generate(best, **params), seeds, metrics
+
+
+def generate_best_map(seed, candidates=64, layout=False):
+    """The best of `candidates` maps searched from `seed`, the same map every time.
+
+    Candidates are generated in this process, which is meant to already be a background
+    worker such as the map pregenerator's.
+    """
+    best, map, _, _ = search_maps(seed, candidates, workers=0)
+    if layout:
+        map = generate_map(best, layout=True)
+    return map
+
+
+if __name__ == "__main__":
+    import time
+
+    # benchmark, scoring throughput and a search over all cores
+    maps = [generate_map(seed) for seed in range(1000)]
+    start = time.perf_counter()
+    metrics = np.array([map_metrics(map) for map in maps], dtype=METRICS)
+    scores = score(metrics)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(maps)} maps in {elapsed:.3f}s, {len(maps) / elapsed:.0f}/s")
+
+    start = time.perf_counter()
+    best, map, seeds, metrics = search_maps(0, 4000)
+    elapsed = time.perf_counter() - start
+    print(f"Searched {len(seeds)} candidates in {elapsed:.2f}s, best seed {best}")
+    for name in METRICS.names:
+        column = metrics[name]
+        print(
+            f"  {name:20} best {map_metrics(map)[name]:8.2f}  "
+            f"min {column.min():8.2f}  mean {column.mean():8.2f}  max {column.max():8.2f}"
+        )
@@ -0,0 +1,268 @@
+""" Force directed node layouts for map graphs.
+
+A Fruchterman-Reingold style simulation, jitted with numba: edges pull their ends together,
+every pair of nodes pushes apart and each node is held by a spring to its anchor, the
+position it was given when its module was integrated, so modules keep their shape and place.
+Repulsion is approximated with a Barnes-Hut quadtree, which makes an iteration O(n log n).
+
+Layouts can be relaxed incrementally: only the given nodes move, while the rest of the map
+still exerts its forces on them.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+from .search import bfs
+
+# cells with at most this many points are not split further
+LEAF_SIZE = 8
+# cells smaller than this are not split either, so coincident points terminate
+MIN_HALF_SIZE = 1e-4
+
+
+@njit(cache=True)
+def _build_quadtree(pos):
+    """Build a quadtree top down over a permutation of the points.
+
+    Returns (perm, cells, links): cells hold (center x, center y, half size, mass, mass
+    center x, mass center y) and links hold (first of four consecutive children or -1 for a
+    leaf, start and end of the cell's points in perm).
+    """
+    n = len(pos)
+    perm = np.arange(n)
+    scratch = np.empty(n, dtype=np.int64)
+    capacity = max(16, 2 * n)
+    cells = np.zeros((capacity, 6))
+    links = np.full((capacity, 3), -1, dtype=np.int64)
+
+    low_x, low_y = pos[:, 0].min(), pos[:, 1].min()
+    high_x, high_y = pos[:, 0].max(), pos[:, 1].max()
+    cells[0, 0] = (low_x + high_x) / 2
+    cells[0, 1] = (low_y + high_y) / 2
+    cells[0, 2] = max(high_x - low_x, high_y - low_y) / 2 + MIN_HALF_SIZE
+    links[0, 1], links[0, 2] = 0, n
+    count = 1
+
+    stack = np.empty(64 * 4 + 4, dtype=np.int64)
+    stack[0] = 0
+    top = 1
+    while top > 0:
+        top -= 1
+        c = stack[top]
+        start, end = links[c, 1], links[c, 2]
+        mass_x = mass_y = 0.0
+        for j in range(start, end):
+            mass_x += pos[perm[j], 0]
+            mass_y += pos[perm[j], 1]
+        cells[c, 3] = end - start
+        cells[c, 4] = mass_x / max(end - start, 1)
+        cells[c, 5] = mass_y / max(end - start, 1)
+        if end - start <= LEAF_SIZE or cells[c, 2] < MIN_HALF_SIZE:
+            continue
+
+        if count + 4 > capacity:
+            capacity *= 2
+            grown_cells = np.zeros((capacity, 6))
+            grown_cells[:count] = cells[:count]
+            grown_links = np.full((capacity, 3), -1, dtype=np.int64)
+            grown_links[:count] = links[:count]
+            cells, links = grown_cells, grown_links
+
+        # counting sort of the cell's points into its quadrants
+        cx, cy, half = cells[c, 0], cells[c, 1], cells[c, 2]
+        sizes = np.zeros(4, dtype=np.int64)
+        for j in range(start, end):
+            p = perm[j]
+            sizes[(pos[p, 0] >= cx) + 2 * (pos[p, 1] >= cy)] += 1
+        offsets = np.empty(4, dtype=np.int64)
+        offsets[0] = start
+        for q in range(1, 4):
+            offsets[q] = offsets[q - 1] + sizes[q - 1]
+        fill = offsets.copy()
+        for j in range(start, end):
+            p = perm[j]
+            q = (pos[p, 0] >= cx) + 2 * (pos[p, 1] >= cy)
+            scratch[fill[q]] = p
+            fill[q] += 1
+        perm[start:end] = scratch[start:end]
+
+        links[c, 0] = count
+        for q in range(4):
+            child = count + q
+            cells[child, 0] = cx + (half / 2 if q & 1 else -half / 2)
+            cells[child, 1] = cy + (half / 2 if q & 2 else -half / 2)
+            cells[child, 2] = half / 2
+            links[child, 1] = offsets[q]
+            links[child, 2] = offsets[q] + sizes[q]
+            if sizes[q]:
+                stack[top] = child
+                top += 1
+        count += 4
+
+    return perm, cells[:count], links[:count]
+
+
+@njit(cache=True, parallel=True)
+def _repulsion(pos, nodes, perm, cells, links, theta, k, force):
+    k2 = k * k
+    for index in prange(len(nodes)):
+        i = nodes[index]
+        px, py = pos[i, 0], pos[i, 1]
+        fx = fy = 0.0
+        stack = np.empty(64 * 4 + 4, dtype=np.int64)
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            c = stack[top]
+            dx, dy = px - cells[c, 4], py - cells[c, 5]
+            d2 = dx * dx + dy * dy
+            if links[c, 0] < 0:
+                for j in range(links[c, 1], links[c, 2]):
+                    other = perm[j]
+                    if other != i:
+                        dx, dy = px - pos[other, 0], py - pos[other, 1]
+                        d2 = dx * dx + dy * dy + 1e-9
+                        fx += k2 * dx / d2
+                        fy += k2 * dy / d2
+            elif 4 * cells[c, 2] * cells[c, 2] < theta * theta * d2:
+                # far enough away to act as a single point at the cell's mass center
+                fx += cells[c, 3] * k2 * dx / d2
+                fy += cells[c, 3] * k2 * dy / d2
+            else:
+                for q in range(4):
+                    child = links[c, 0] + q
+                    if cells[child, 3] > 0:
+                        stack[top] = child
+                        top += 1
+        force[i, 0] += fx
+        force[i, 1] += fy
+
+
+@njit(cache=True)
+def _attraction(pos, src, dst, k, force):
+    for e in range(len(src)):
+        u, v = src[e], dst[e]
+        dx, dy = pos[v, 0] - pos[u, 0], pos[v, 1] - pos[u, 1]
+        d = np.sqrt(dx * dx + dy * dy)
+        fx, fy = d * dx / k, d * dy / k
+        force[u, 0] += fx
+        force[u, 1] += fy
+        force[v, 0] -= fx
+        force[v, 1] -= fy
+
+
+@njit(cache=True)
+def _relax(pos, anchors, nodes, src, dst, iterations, k, theta, strength, temperature):
+    force = np.zeros_like(pos)
+    movable = np.zeros(len(pos), dtype=np.bool_)
+    movable[nodes] = True
+    for iteration in range(iterations):
+        force[:] = 0.0
+        perm, cells, links = _build_quadtree(pos)
+        # visit the nodes in quadtree order, neighbouring nodes walk the same cells
+        _repulsion(pos, perm[movable[perm]], perm, cells, links, theta, k, force)
+        _attraction(pos, src, dst, k, force)
+
+        # displacements are capped by a temperature which cools down linearly
+        step = temperature * (1 - iteration / iterations)
+        for i in nodes:
+            fx = force[i, 0] + strength * (anchors[i, 0] - pos[i, 0])
+            fy = force[i, 1] + strength * (anchors[i, 1] - pos[i, 1])
+            length = np.sqrt(fx * fx + fy * fy)
+            if length > 0:
+                scale = min(length, step) / length
+                pos[i, 0] += fx * scale
+                pos[i, 1] += fy * scale
+
+
+def force_layout(
+    map,
+    nodes=None,
+    iterations=100,
+    k=1.0,
+    theta=0.8,
+    anchor_strength=0.5,
+    temperature=1.0,
+    anchors=None,
+):
+    """Relax the node positions of a map in place.
+
+    Only `nodes` move, all of them by default. `k` is the ideal edge length, `theta` the
+    Barnes-Hut opening angle, and every node is pulled back to its position in `anchors`,
+    its current position by default, with `anchor_strength`.
+    """
+    pos = map.positions.astype(np.float64)
+    anchors = pos.copy() if anchors is None else np.asarray(anchors, dtype=np.float64)
+    if nodes is None:
+        nodes = np.arange(len(map))
+    nodes = np.asarray(nodes, dtype=np.int64)
+    if len(map) < 2 or not len(nodes):
+        return map
+
+    src, dst = map.edge_arrays()
+    _relax(
+        pos,
+        anchors,
+        nodes,
+        src,
+        dst,
+        iterations,
+        k,
+        theta,
+        anchor_strength,
+        temperature,
+    )
+    map.positions[:] = pos
+    # the moved nodes' edges changed length, in and out
+    moved = np.zeros(len(map), dtype=bool)
+    moved[nodes] = True
+    map._touch(np.union1d(nodes, src[moved[dst]]))
+    return map
+
+
+def relax_around(map, nodes, radius=2, iterations=30, **kwargs):
+    """Incrementally relax the layout around some nodes, e.g. a newly integrated module.
+
+    Only the nodes within `radius` hops of `nodes`, in either direction, move.
+    """
+    forward = bfs(map, nodes, max_depth=radius)[0]
+    backward = bfs(map, nodes, max_depth=radius, reverse=True)[0]
+    near = np.flatnonzero((forward >= 0) | (backward >= 0))
+    kwargs.setdefault("temperature", 0.5)
+    return force_layout(map, near, iterations, **kwargs)
+
+
+if __name__ == "__main__":
+    import time
+
+    from .builders.gamegen import GameGraph
+    from .builders.lazy import expand_stubs
+
+    # benchmark, a full layout of a large map and an incremental relaxation
+    rng = np.random.default_rng(0)
+    size = 100_000
+    map = GameGraph(capacity=size)
+    map._allocate_nodes(size)
+    map.positions[:] = rng.uniform(0, 300, (size, 2))
+    map.add_edges(np.arange(size - 1), np.arange(1, size))
+    map.add_edges(rng.integers(0, size, size // 10), rng.integers(0, size, size // 10))
+
+    force_layout(map, iterations=1)  # compile
+    start = time.perf_counter()
+    force_layout(map, iterations=50)
+    print(f"Laid out {size} nodes, 50 iterations in {time.perf_counter() - start:.2f}s")
+
+    stubs = rng.choice(size, 100, replace=False)
+    map.column("stub_kinds")[stubs] = 1
+    before = len(map)
+    expand_stubs(map, stubs)
+    new = np.arange(before, len(map))
+    positions = map.positions.copy()
+    start = time.perf_counter()
+    relax_around(map, np.concatenate((stubs, new)))
+    moved = np.count_nonzero((map.positions != positions).any(axis=1))
+    print(
+        f"Relaxed around {len(stubs)} new modules in {time.perf_counter() - start:.2f}s,"
+        f" {moved} nodes moved"
+    )
@@ -1,88 +1,582 @@
-import random
-import networkx as nx
+import numpy as np
+from numba import njit
 
 
-class GraphModule(nx.DiGraph):
+def _chain(keys, start, stop, first, next_):
+    """Head insert the edge slots start:stop into the per node lists of their `keys`."""
+    slots = np.arange(start, stop, dtype=np.int32)
+    order = np.argsort(keys[start:stop], kind="stable")
+    nodes, slots = keys[start:stop][order], slots[order]
+    if not len(slots):
+        return
+    # runs of the same node chain in slot order, the last of a run to the old head
+    same = nodes[1:] == nodes[:-1]
+    last = np.append(~same, True)
+    links = np.append(np.where(same, slots[1:], -1), -1)
+    links[last] = first[nodes[last]]
+    next_[slots] = links
+    heads = np.insert(~same, 0, True)
+    first[nodes[heads]] = slots[heads]
+
+
+@njit(cache=True)
+def _move_out_edges(first_out, next_out, first_in, next_in, src, dst, nodes, exits):
+    """Move the out edges of `nodes` to `exits`, through the per node edge lists.
+
+    Returns the targets of the moved edges and the sources of the nodes' in edges.
+    """
+    out_count = in_count = 0
+    for u in nodes:
+        slot = first_out[u]
+        while slot >= 0:
+            out_count += 1
+            slot = next_out[slot]
+        slot = first_in[u]
+        while slot >= 0:
+            in_count += 1
+            slot = next_in[slot]
+    targets = np.empty(out_count, dtype=np.int32)
+    sources = np.empty(in_count, dtype=np.int32)
+
+    k = 0
+    for i in range(len(nodes)):
+        u, e = nodes[i], exits[i]
+        slot, last = first_out[u], -1
+        while slot >= 0:
+            targets[k] = dst[slot]
+            k += 1
+            if e != u:
+                src[slot] = e
+            last, slot = slot, next_out[slot]
+        if last >= 0 and e != u:
+            next_out[last] = first_out[e]
+            first_out[e] = first_out[u]
+            first_out[u] = -1
+    k = 0
+    for u in nodes:
+        slot = first_in[u]
+        while slot >= 0:
+            sources[k] = src[slot]
+            k += 1
+            slot = next_in[slot]
+    return targets, sources
+
+
+@njit(cache=True)
+def _walk_lists(first, next_, values, nodes):
+    """The length of each of `nodes`' edge lists and the `values` of their slots."""
+    counts = np.zeros(len(nodes), dtype=np.int64)
+    for i in range(len(nodes)):
+        slot = first[nodes[i]]
+        while slot >= 0:
+            counts[i] += 1
+            slot = next_[slot]
+    found = np.empty(counts.sum(), dtype=values.dtype)
+    k = 0
+    for u in nodes:
+        slot = first[u]
+        while slot >= 0:
+            found[k] = values[slot]
+            k += 1
+            slot = next_[slot]
+    return counts, found
+
+
+class GraphModule:
     """A GraphModule is a graph that is a node in a larger graph.
     Because a game map is uninteresting when it's just a random graph, we will use pre-defined graph structures to generate the game map.
 
     When we have a simple top-level graph, we can replace it's nodes with GraphModules to create a more complex graph.
+
+    Nodes are integer ids indexing into column arrays (positions, interned label ids and the
+    module instance that owns them). Edges are stored as growable source/target arrays and
+    compiled on demand into CSR adjacency, which is cached until the next edit.
+
+    A node can also be an unexpanded module stub: a non-zero `stub_kinds` entry together with
+    the seed and nesting depth the module should be expanded with. `regions` tags nodes with
+    a caller defined region, inherited by the nodes of any module integrated in their place.
     """
 
-    module_counter = 0
+    NODE_COLUMNS = {
+        "positions": (np.float32, (2,), 0),
+        "label_ids": (np.int32, (), 0),
+        "module_ids": (np.int32, (), -1),
+        "stub_kinds": (np.int8, (), 0),
+        "seeds": (np.uint64, (), 0),
+        "depths": (np.int32, (), 0),
+        "regions": (np.int32, (), -1),
+    }
 
-    def __init__(self, incoming_graph_data=None, **attr):
-        super().__init__(incoming_graph_data, **attr)
+    def __init__(self, capacity=16):
         self.entry_node = None
         self.exit_node = None
 
+        # bumped on every edit, used to invalidate anything derived from the graph
+        self.version = 0
+        # bumped only when nodes or edges are added or edges move, the compiled CSR
+        # survives edits of positions and stubs
+        self._topology = 0
+        # called with the ids of the nodes touched by each edit
+        self.observers = []
+
+        # interned label table, nodes only store an index into it
+        self.labels = []
+        self._label_index = {}
+
+        # the node each integrated module instance replaced, indexed by module id
+        self.module_anchors = []
+
+        self._n = 0
+        self._columns = {
+            name: np.full((capacity, *shape), fill, dtype=dtype)
+            for name, (dtype, shape, fill) in self.NODE_COLUMNS.items()
+        }
+
+        self._m = 0
+        self._src = np.zeros(capacity, dtype=np.int32)
+        self._dst = np.zeros(capacity, dtype=np.int32)
+
+        self._csr = None
+        self._csr_version = -1
+        # per node linked lists of out and in edge slots, head and next slot, or -1
+        self._first_out = self._next_out = self._first_in = self._next_in = None
+
+    # node columns
+    @property
+    def positions(self):
+        return self._columns["positions"][: self._n]
+
+    @property
+    def label_ids(self):
+        return self._columns["label_ids"][: self._n]
+
+    @property
+    def module_ids(self):
+        return self._columns["module_ids"][: self._n]
+
+    @property
+    def stub_kinds(self):
+        return self._columns["stub_kinds"][: self._n]
+
+    def column(self, name):
+        return self._columns[name][: self._n]
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, node):
+        return 0 <= node < self._n
+
+    def number_of_nodes(self):
+        return self._n
+
+    def number_of_edges(self):
+        return len(self.csr()[1])
+
+    def nodes(self):
+        return range(self._n)
+
+    # construction
     def set_entry_exit(self, entry, exit):
         """Set the entry and exit nodes for the module."""
-        if entry in self.nodes and exit in self.nodes:
-            self.entry_node = entry
-            self.exit_node = exit
+        if entry in self and exit in self:
+            # plain ints, node ids are often numpy scalars and those don't serialize
+            self.entry_node = int(entry)
+            self.exit_node = int(exit)
         else:
             raise ValueError("Entry/Exit nodes must be part of the module.")
 
-    def __offset_module_by_pos(self, module, pos):
-        # Offset module's nodes positions based on the original node's position and add them
-        for n, attrs in module.nodes(data=True):
-            module_pos = attrs.get("position", (0, 0))
-            offset_pos = (
-                pos[0] + module_pos[0],
-                pos[1] + module_pos[1],
-            )
-            attrs["position"] = offset_pos
-            self.add_node(n, **attrs)  # Add updated position to attrs
-
-        # update the edges in the main graph from the module
-        for u, v, attrs in module.edges(data=True):
-            u_offset = (
-                pos[0] + module.nodes[u]["position"][0],
-                pos[1] + module.nodes[u]["position"][1],
-            )
-            v_offset = (
-                pos[0] + module.nodes[v]["position"][0],
-                pos[1] + module.nodes[v]["position"][1],
-            )
-            attrs["position"] = (u_offset, v_offset)
-            self.add_edge(u, v, **attrs)
+    def intern_label(self, label):
+        """Return the index of a label in the label table, adding it if needed."""
+        index = self._label_index.get(label)
+        if index is None:
+            index = self._label_index[label] = len(self.labels)
+            self.labels.append(label)
+        return index
+
+    def label(self, node):
+        return self.labels[self.label_ids[node]]
+
+    def node_name(self, node):
+        """A readable name for a node, only meant for logs and tooling."""
+        return f"{self.label(node)}_{node}"
+
+    def add_node(self, label, position=(0, 0)):
+        """Add a node and return its id."""
+        node = self._allocate_nodes(1)[0]
+        self._columns["positions"][node] = position
+        self._columns["label_ids"][node] = self.intern_label(label)
+        self._touch([node])
+        return node
+
+    def add_positioned_module_node(self, label, position, **attr):
+        """Add a node with a specified position."""
+        return self.add_node(label, position)
+
+    def add_edge(self, u, v):
+        self.add_edges(np.array([u]), np.array([v]))
+
+    def add_edges_from(self, edges):
+        edges = np.asarray(list(edges), dtype=np.int32).reshape(-1, 2)
+        self.add_edges(edges[:, 0], edges[:, 1])
+
+    def add_edges(self, src, dst):
+        """Add edges from parallel source/target id arrays."""
+        count = len(src)
+        self._reserve_edges(count)
+        self._src[self._m : self._m + count] = src
+        self._dst[self._m : self._m + count] = dst
+        if self._first_out is not None:
+            _chain(self._src, self._m, self._m + count, self._first_out, self._next_out)
+            _chain(self._dst, self._m, self._m + count, self._first_in, self._next_in)
+        self._m += count
+        self._topology += 1
+        self._touch(np.concatenate((src, dst)))
+
+    def module_nodes(self, module_id):
+        return np.flatnonzero(self.module_ids == module_id)
 
     def integrate_module(self, node, module):
-        """Replace a node with a module, offsetting module positions by the original node's position."""
-        if not module.entry_node or not module.exit_node:
-            raise ValueError("Module must have defined entry and exit nodes.")
+        """Replace a node with a module, offsetting module positions by the original node's position.
 
-        # Check if the node exists and get its position
+        The replaced node's id is reused for the module's entry node, so its in-edges stay
+        valid, and its out-edges are moved to the module's exit node. Returns the ids the
+        module's nodes were given in this graph.
+        """
         if node not in self:
             raise KeyError(f"Node '{node}' not found in the graph.")
-        original_pos = self.nodes[node].get("position", (0, 0))
+        return self.integrate_modules([node], module)[0]
 
-        in_edges = list(self.in_edges(node, data=True))
-        out_edges = list(self.out_edges(node, data=True))
-        self.remove_node(node)
+    def integrate_modules(self, nodes, module):
+        """Replace each of several distinct nodes with an instance of the same module, in one pass.
 
-        #  add all nodes as node_{module_node}
-        for n in list(module.nodes):
-            self.add_node(f"{node}_{n}", **module.nodes[n])
+        Returns a (len(nodes), len(module)) array, the ids of each instance's nodes.
+        """
+        if module.entry_node is None or module.exit_node is None:
+            raise ValueError("Module must have defined entry and exit nodes.")
+        nodes = np.asarray(nodes, dtype=np.int32)
+        count, size = len(nodes), len(module)
+        if not count:
+            return np.zeros((0, size), dtype=np.int32)
 
-        self.__offset_module_by_pos(module, original_pos)
+        ids = np.empty((count, size), dtype=np.int32)
+        others = np.arange(size) != module.entry_node
+        ids[:, others] = self._allocate_nodes(count * (size - 1)).reshape(count, -1)
+        ids[:, module.entry_node] = nodes
 
-        # Reconnect edges to the entry and exit nodes of the module
-        for u, v, attrs in in_edges:
-            self.add_edge(u, module.entry_node, **attrs)
-        for u, v, attrs in out_edges:
-            self.add_edge(module.exit_node, v, **attrs)
+        label_map = np.array(
+            [self.intern_label(label) for label in module.labels], dtype=np.int32
+        )
+        module_ids = np.arange(count, dtype=np.int32) + len(self.module_anchors)
+        self.module_anchors.extend(nodes.tolist())
+        for name, column in self._columns.items():
+            if name == "positions":
+                column[ids] = module.positions + column[nodes][:, None]
+            elif name == "label_ids":
+                column[ids] = label_map[module.label_ids]
+            elif name == "module_ids":
+                column[ids] = module_ids[:, None]
+            elif name == "regions":
+                column[ids] = column[nodes][:, None]
+            else:
+                column[ids] = module.column(name)
 
-    def add_positioned_module_node(self, label, position, **attr):
-        """Add a node with a specified position."""
-        node = f"{label}_{self.new_unique_id()}"
-        attr["position"] = position
-        self.add_node(node, **attr)
-        return node
+        # Reconnect the out edges to the exit nodes of the instances, only the replaced
+        # nodes' edges are visited
+        targets, sources = _move_out_edges(
+            *self._edge_lists(),
+            self._src,
+            self._dst,
+            nodes,
+            ids[:, module.exit_node],
+        )
+        self._topology += 1
+
+        module_src, module_dst = module.edge_arrays()
+        self.add_edges(ids[:, module_src].ravel(), ids[:, module_dst].ravel())
+        self._touch(np.concatenate((ids.ravel(), sources, targets)))
+
+        return ids
+
+    # adjacency
+    def csr(self):
+        """Return the (indptr, indices) CSR adjacency of outgoing edges."""
+        return self._compile()[:2]
+
+    def reverse_csr(self):
+        """Return the (indptr, indices) CSR adjacency of incoming edges."""
+        return self._compile()[2:]
+
+    def edge_arrays(self):
+        """Return deduplicated (source, target) arrays, sorted by source."""
+        self._compile()
+        return self._src[: self._m], self._dst[: self._m]
+
+    def neighbors(self, node):
+        indptr, indices = self.csr()
+        return indices[indptr[node] : indptr[node + 1]]
+
+    successors = neighbors
+
+    def predecessors(self, node):
+        indptr, indices = self.reverse_csr()
+        return indices[indptr[node] : indptr[node + 1]]
+
+    def listed_successors(self, nodes):
+        """(out degrees, successors) of `nodes`, read from the edge lists.
+
+        Unlike `csr` this doesn't compile the whole graph after an edit, so it costs what
+        the nodes' edges do. Edges added more than once count more than once until the
+        next compile.
+        """
+        first_out, next_out, _, _ = self._edge_lists()
+        return _walk_lists(
+            first_out, next_out, self._dst, np.asarray(nodes, dtype=np.int32)
+        )
+
+    def has_edge(self, u, v):
+        return bool((self.neighbors(u) == v).any())
+
+    def out_degree(self, node=None):
+        degrees = np.diff(self.csr()[0])
+        return degrees if node is None else int(degrees[node])
+
+    def in_degree(self, node=None):
+        degrees = np.diff(self.reverse_csr()[0])
+        return degrees if node is None else int(degrees[node])
+
+    def degree(self, node=None):
+        degrees = self.out_degree() + self.in_degree()
+        return degrees if node is None else int(degrees[node])
+
+    # conversion
+    def to_networkx(self):
+        """Build an equivalent networkx DiGraph, with `label` and `position` node attributes."""
+        # imported here, networkx is slow to import and only needed for conversions
+        import networkx as nx
+
+        graph = nx.DiGraph(entry_node=self.entry_node, exit_node=self.exit_node)
+        for node, (label_id, position) in enumerate(
+            zip(self.label_ids.tolist(), self.positions.tolist())
+        ):
+            graph.add_node(node, label=self.labels[label_id], position=tuple(position))
+        graph.add_edges_from(zip(*(a.tolist() for a in self.edge_arrays())))
+        return graph
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Build a module from a networkx graph, using its `label` and `position` node attributes."""
+        module = cls(capacity=max(len(graph), 1))
+        ids = {}
+        for node, attrs in graph.nodes(data=True):
+            ids[node] = module.add_node(
+                attrs.get("label", str(node)), attrs.get("position", (0, 0))
+            )
+        module.add_edges_from((ids[u], ids[v]) for u, v in graph.edges())
+
+        entry = getattr(graph, "entry_node", graph.graph.get("entry_node"))
+        exit = getattr(graph, "exit_node", graph.graph.get("exit_node"))
+        if entry in ids and exit in ids:
+            module.set_entry_exit(ids[entry], ids[exit])
+        return module
+
+    def add_disjoint(self, module):
+        """Add all nodes and edges of another module, unconnected. Returns their new ids."""
+        ids = self._allocate_nodes(len(module))
+        label_map = np.array(
+            [self.intern_label(label) for label in module.labels], dtype=np.int32
+        )
+        module_offset = len(self.module_anchors)
+        self.module_anchors.extend(ids[module.module_anchors].tolist())
+        for name, column in self._columns.items():
+            if name == "label_ids":
+                column[ids] = label_map[module.label_ids]
+            elif name == "module_ids":
+                column[ids] = np.where(
+                    module.module_ids >= 0, module.module_ids + module_offset, -1
+                )
+            else:
+                column[ids] = module.column(name)
+
+        module_src, module_dst = module.edge_arrays()
+        self.add_edges(ids[module_src], ids[module_dst])
+        self._touch(ids)
+        return ids
+
+    def subgraph(self, nodes):
+        """Extract the given nodes and the edges between them as a new module.
+
+        Nodes are renumbered by their rank in `nodes`, which should be sorted.
+        """
+        nodes = np.asarray(nodes, dtype=np.int32)
+        local = np.full(self._n, -1, dtype=np.int32)
+        local[nodes] = np.arange(len(nodes), dtype=np.int32)
+
+        module = type(self)(capacity=max(len(nodes), 1))
+        module._allocate_nodes(len(nodes))
+        module.labels = list(self.labels)
+        module._label_index = dict(self._label_index)
+        for name, column in self._columns.items():
+            module._columns[name][: len(nodes)] = column[nodes]
+
+        # keep only the module instances owning one of the extracted nodes
+        owners = self.module_ids[nodes]
+        used = np.unique(owners[owners >= 0])
+        module.module_anchors = local[
+            np.asarray(self.module_anchors, dtype=np.int32)[used]
+        ].tolist()
+        module.module_ids[:] = np.where(owners >= 0, np.searchsorted(used, owners), -1)
+
+        src, dst = self.edge_arrays()
+        inside = (local[src] >= 0) & (local[dst] >= 0)
+        module.add_edges(local[src[inside]], local[dst[inside]])
+
+        for name in ("entry_node", "exit_node"):
+            node = getattr(self, name)
+            if node is not None and local[node] >= 0:
+                setattr(module, name, int(local[node]))
+        return module
+
+    @property
+    def nbytes(self):
+        """Memory held by the node columns and edge arrays."""
+        return sum(column.nbytes for column in self._columns.values()) + (
+            self._src.nbytes + self._dst.nbytes
+        )
+
+    @classmethod
+    def from_csr(
+        cls,
+        columns,
+        csr,
+        reverse_csr,
+        labels,
+        module_anchors,
+        entry=None,
+        exit=None,
+    ):
+        """Build a module around existing node columns and compiled CSR adjacency.
+
+        The arrays are adopted without copying, so memory mapped arrays are only read in as
+        they are touched. Columns missing from `columns` are filled with their default.
+        """
+        indptr, indices = csr
+        size = len(indptr) - 1
+        module = cls(capacity=0)
+        module._n = size
+        for name, (dtype, shape, fill) in cls.NODE_COLUMNS.items():
+            if name in columns:
+                module._columns[name] = columns[name]
+            else:
+                module._columns[name] = np.full((size, *shape), fill, dtype=dtype)
+
+        module._m = len(indices)
+        module._src = np.repeat(np.arange(size, dtype=np.int32), np.diff(indptr))
+        module._dst = indices
+        module._csr = (indptr, indices, *reverse_csr)
+        module._csr_version = module._topology
+
+        module.labels = list(labels)
+        module._label_index = {label: i for i, label in enumerate(module.labels)}
+        module.module_anchors = list(module_anchors)
+        module.entry_node, module.exit_node = entry, exit
+        return module
+
+    # storage
+    def _edge_lists(self):
+        """The per node edge lists, built on first use and kept up to date from then on."""
+        if self._first_out is None:
+            nodes, edges = len(self._columns["positions"]), len(self._src)
+            self._first_out = np.full(nodes, -1, dtype=np.int32)
+            self._first_in = np.full(nodes, -1, dtype=np.int32)
+            self._next_out = np.full(edges, -1, dtype=np.int32)
+            self._next_in = np.full(edges, -1, dtype=np.int32)
+            _chain(self._src, 0, self._m, self._first_out, self._next_out)
+            _chain(self._dst, 0, self._m, self._first_in, self._next_in)
+        return self._first_out, self._next_out, self._first_in, self._next_in
+
+    def _touch(self, nodes=()):
+        self.version += 1
+        for observer in self.observers:
+            observer(nodes)
+
+    def _allocate_nodes(self, count):
+        start = self._n
+        if start + count > len(self._columns["positions"]):
+            capacity = max(2 * len(self._columns["positions"]), start + count)
+            for name, (dtype, shape, fill) in self.NODE_COLUMNS.items():
+                column = np.full((capacity, *shape), fill, dtype=dtype)
+                column[:start] = self._columns[name][:start]
+                self._columns[name] = column
+            if self._first_out is not None:
+                for name in ("_first_out", "_first_in"):
+                    heads = np.full(capacity, -1, dtype=np.int32)
+                    heads[:start] = getattr(self, name)[:start]
+                    setattr(self, name, heads)
+        self._n += count
+        self._topology += 1
+        return np.arange(start, start + count, dtype=np.int32)
+
+    def _reserve_edges(self, count):
+        if self._m + count > len(self._src):
+            capacity = max(2 * len(self._src), self._m + count)
+            for name in ("_src", "_dst"):
+                array = np.zeros(capacity, dtype=np.int32)
+                array[: self._m] = getattr(self, name)[: self._m]
+                setattr(self, name, array)
+            if self._first_out is not None:
+                for name in ("_next_out", "_next_in"):
+                    links = np.full(capacity, -1, dtype=np.int32)
+                    links[: self._m] = getattr(self, name)[: self._m]
+                    setattr(self, name, links)
+
+    def _compile(self):
+        """Deduplicate the edge arrays and build forward and reverse CSR adjacency.
+
+        The edges are compiled into new arrays, so the adjacency handed out before stays
+        valid.
+        """
+        if self._csr_version == self._topology:
+            return self._csr
+
+        n = self._n
+        # sort edges by (source, target) packed into one key and drop repeats
+        keys = np.sort(self._src[: self._m].astype(np.int64) * n + self._dst[: self._m])
+        if len(keys):
+            keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        self._m = len(keys)
+        capacity = len(self._src)
+        self._src = np.zeros(capacity, dtype=np.int32)
+        self._dst = np.zeros(capacity, dtype=np.int32)
+        self._src[: self._m] = keys // n
+        self._dst[: self._m] = keys % n
+        src, dst = self._src[: self._m], self._dst[: self._m]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+
+        reverse_order = np.argsort(dst.astype(np.int64) * n + src)
+        reverse_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dst, minlength=n), out=reverse_indptr[1:])
+        if self._first_out is not None:
+            self.__relink(indptr, src, reverse_indptr, reverse_order, dst)
+
+        self._csr = (indptr, dst, reverse_indptr, src[reverse_order])
+        self._csr_version = self._topology
+        return self._csr
 
-    def new_unique_id(self):
-        """Generate a new unique ID for a module."""
-        unique_id = self.module_counter
-        self.module_counter += 1
-        return unique_id
+    def __relink(self, indptr, src, reverse_indptr, reverse_order, dst):
+        # deduplicating moved the edges around, rebuild the edge lists from the sorted runs
+        n, m = self._n, self._m
+        for first, next_, starts, order, keys in (
+            (self._first_out, self._next_out, indptr, np.arange(m), src),
+            (self._first_in, self._next_in, reverse_indptr, reverse_order, dst),
+        ):
+            first[:n] = -1
+            if m:
+                runs = np.diff(starts) > 0
+                first[:n][runs] = order[starts[:-1][runs]]
+                keys = keys[order]
+                next_[order] = np.append(
+                    np.where(keys[1:] == keys[:-1], order[1:], -1), -1
+                )
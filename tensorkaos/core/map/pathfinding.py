@@ -0,0 +1,224 @@
+""" Hierarchical pathfinding (HPA*) over the module clusters of a map.
+
+Every integrated module instance is a cluster. The abstract graph has the cluster boundary
+nodes, the module entries and exits with an edge leaving or entering the cluster, as its
+nodes. They are joined by the edges between clusters and by intra-cluster hop distances,
+which are precomputed per cluster. Queries run A* on the abstract graph and are refined
+into map nodes one abstract edge at a time, only as far as they are consumed.
+
+The pathfinder observes its graph, so an edit such as `integrate_module` rewriting a node
+only marks the clusters it touched as dirty, and they are rebuilt before the next query.
+"""
+
+import heapq
+import numpy as np
+
+from collections import deque
+
+
+class Cluster:
+    """The nodes of one module instance and the hop distances between its boundary nodes."""
+
+    def __init__(self, graph, nodes):
+        self.graph = graph
+        self.nodes = nodes
+        self.boundary = set()
+        # boundary node -> (distance, parent) dicts of a BFS inside the cluster
+        self.searches = {}
+
+    def contains(self, node):
+        return node in self.members
+
+    def build(self, cluster_of):
+        graph = self.graph
+        self.members = set(self.nodes.tolist())
+        self.boundary = {
+            node
+            for node in self.members
+            if any(cluster_of[n] != cluster_of[node] for n in graph.successors(node))
+            or any(cluster_of[n] != cluster_of[node] for n in graph.predecessors(node))
+        }
+        self.searches = {node: self.search(node) for node in self.boundary}
+
+    def search(self, source, reverse=False):
+        """BFS restricted to the cluster, following incoming edges with `reverse`."""
+        neighbors = self.graph.predecessors if reverse else self.graph.successors
+        distance, parent = {source: 0}, {source: None}
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for v in neighbors(u).tolist():
+                if v in self.members and v not in distance:
+                    distance[v] = distance[u] + 1
+                    parent[v] = u
+                    queue.append(v)
+        return distance, parent
+
+
+class HierarchicalPathfinder:
+    def __init__(self, graph):
+        self.graph = graph
+        self.clusters = {}
+        self._cluster_of = np.zeros(0, dtype=np.int32)
+        self._dirty = set()
+        self._dirty_nodes = np.zeros(0, dtype=np.int64)
+        self._max_edge_length = 0.0
+
+        graph.observers.append(self._on_edit)
+        self.rebuild()
+
+    def close(self):
+        """Stop observing the graph."""
+        self.graph.observers.remove(self._on_edit)
+
+    def rebuild(self):
+        """Build the abstract graph from scratch."""
+        graph = self.graph
+        self._cluster_of = graph.module_ids.copy()
+        self._max_edge_length = 0.0
+        self._update_edge_length(np.arange(len(graph)))
+
+        order = np.argsort(self._cluster_of, kind="stable")
+        ids, starts = np.unique(self._cluster_of[order], return_index=True)
+        self.clusters = {
+            int(cluster): Cluster(graph, nodes)
+            for cluster, nodes in zip(ids, np.split(order, starts[1:]))
+        }
+        for cluster in self.clusters.values():
+            cluster.build(self._cluster_of)
+        self._dirty.clear()
+        self._dirty_nodes = np.zeros(0, dtype=np.int64)
+
+    # incremental updates
+    def _on_edit(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if not len(nodes):
+            return
+        known = nodes[nodes < len(self._cluster_of)]
+        self._dirty.update(self._cluster_of[known].tolist())
+        self._dirty.update(self.graph.module_ids[nodes].tolist())
+        self._dirty_nodes = np.union1d(self._dirty_nodes, nodes)
+
+    def refresh(self):
+        """Rebuild the clusters touched since the last query."""
+        if not self._dirty:
+            return
+        graph = self.graph
+        nodes, self._dirty_nodes = self._dirty_nodes, np.zeros(0, dtype=np.int64)
+
+        cluster_of = np.full(len(graph), -1, dtype=np.int32)
+        cluster_of[: len(self._cluster_of)] = self._cluster_of
+        cluster_of[nodes] = graph.module_ids[nodes]
+        self._cluster_of = cluster_of
+        self._update_edge_length(nodes)
+
+        for cluster in self._dirty:
+            members = nodes[cluster_of[nodes] == cluster]
+            if cluster in self.clusters:
+                members = np.union1d(self.clusters[cluster].nodes, members)
+            members = members[cluster_of[members] == cluster].astype(np.int32)
+            if len(members):
+                self.clusters[cluster] = Cluster(graph, members)
+                self.clusters[cluster].build(cluster_of)
+            else:
+                self.clusters.pop(cluster, None)
+        self._dirty.clear()
+
+    def _update_edge_length(self, nodes):
+        # an upper bound on the length of one hop keeps the euclidean heuristic admissible
+        positions = self.graph.positions
+        for node in nodes.tolist():
+            successors = self.graph.successors(node)
+            if len(successors):
+                lengths = np.linalg.norm(
+                    positions[successors] - positions[node], axis=1
+                )
+                self._max_edge_length = max(self._max_edge_length, float(lengths.max()))
+
+    # queries
+    def _heuristic(self, node, goal):
+        if self._max_edge_length == 0:
+            return 0
+        positions = self.graph.positions
+        return float(np.linalg.norm(positions[node] - positions[goal])) / (
+            self._max_edge_length
+        )
+
+    def abstract_path(self, start, goal):
+        """The waypoints of a fewest-hop path over the abstract graph, None if unreachable."""
+        self.refresh()
+        cluster_of = self._cluster_of
+        goal_cluster = self.clusters[int(cluster_of[goal])]
+        to_goal = goal_cluster.search(goal, reverse=True)[0]
+
+        def neighbors(node):
+            cluster = self.clusters[int(cluster_of[node])]
+            if node == start:
+                distance = cluster.search(start)[0]
+            else:
+                distance = cluster.searches[node][0]
+            for other in cluster.boundary:
+                if other != node and other in distance:
+                    yield other, distance[other]
+            if cluster is goal_cluster and node in to_goal:
+                yield goal, to_goal[node]
+            if node in cluster.boundary:
+                for other in self.graph.successors(node).tolist():
+                    if cluster_of[other] != cluster_of[node]:
+                        yield other, 1
+
+        cost = {start: 0}
+        parent = {start: None}
+        closed = set()
+        frontier = [(self._heuristic(start, goal), start)]
+        while frontier:
+            _, node = heapq.heappop(frontier)
+            if node in closed:
+                continue
+            closed.add(node)
+            if node == goal:
+                waypoints = [goal]
+                while parent[waypoints[-1]] is not None:
+                    waypoints.append(parent[waypoints[-1]])
+                return waypoints[::-1]
+            for other, step in neighbors(node):
+                new_cost = cost[node] + step
+                if new_cost < cost.get(other, np.inf):
+                    cost[other] = new_cost
+                    parent[other] = node
+                    heapq.heappush(
+                        frontier, (new_cost + self._heuristic(other, goal), other)
+                    )
+        return None
+
+    def refine(self, waypoints):
+        """Lazily expand abstract waypoints into the map nodes of the path, start included."""
+        yield waypoints[0]
+        for u, v in zip(waypoints, waypoints[1:]):
+            cluster_u = self.clusters[int(self._cluster_of[u])]
+            if cluster_u.contains(v):
+                # intra-cluster edge: walk the parents of a BFS from v backwards
+                parent = cluster_u.search(v, reverse=True)[1]
+                node = u
+                while node != v:
+                    node = parent[node]
+                    yield node
+            else:
+                yield v
+
+    def find_path(self, start, goal):
+        """A lazily refined path from start to goal, None if the goal is unreachable."""
+        if start == goal:
+            return iter([start])
+        waypoints = self.abstract_path(start, goal)
+        if waypoints is None:
+            return None
+        return self.refine(waypoints)
+
+    def next_step(self, start, goal):
+        """The node to move to from start towards goal, None if there is none."""
+        path = self.find_path(start, goal)
+        if path is None:
+            return None
+        next(path)
+        return next(path, None)
@@ -0,0 +1,90 @@
+""" Speculative map generation in a background process.
+
+While the title screen is up, the next map is generated in a worker process, so it neither
+holds the GIL nor stalls the frame. The worker writes the map to the MapCache and the result
+is handed over by loading the cache file, which is renamed into place only once it is
+complete. If the map is not ready when it is asked for, it is generated synchronously.
+"""
+
+import logging
+import multiprocessing
+import random
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .builders.generators import generate_map
+from .storage import MapCache
+
+log = logging.getLogger(__name__)
+
+
+def _pregenerate(cache_path, generate, seed, params):
+    MapCache(cache_path).get(generate, seed, **params)
+    return seed
+
+
+class MapPregenerator:
+    def __init__(self, cache, generate=generate_map, **params):
+        self.cache = cache
+        self.generate = generate
+        self.params = params
+
+        self.seed = None
+        self._future = None
+        self._executor = None
+
+    def start(self, seed=None):
+        """Start generating the map for `seed`, a random one by default, in the background."""
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        try:
+            self._future = self._submit(seed)
+        except BrokenProcessPool:
+            # the worker died, e.g. killed for memory, start over with a new one
+            log.warning("The map pregenerator's worker died, restarting it")
+            self.close()
+            self._future = self._submit(seed)
+        return seed
+
+    def _submit(self, seed):
+        if self._executor is None:
+            # spawn rather than fork, the parent process holds a GL context
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor.submit(
+            _pregenerate, self.cache.path, self.generate, seed, self.params
+        )
+
+    @property
+    def ready(self):
+        return self._future is not None and self._future.done()
+
+    def take(self):
+        """Return (seed, map) for the pregenerated map, generating it here if it isn't ready."""
+        future, seed = self._future, self.seed
+        self._future = self.seed = None
+
+        if future is None:
+            seed = random.getrandbits(64)
+        elif not future.done():
+            log.debug(
+                f"Map {seed} is not pregenerated yet, generating it synchronously"
+            )
+        elif future.exception() is not None:
+            log.warning(f"Pregenerating map {seed} failed: {future.exception()}")
+        # both the worker and this fallback go through the cache, so whichever finishes
+        # second only replaces the file with an identical map
+        return seed, self.cache.get(self.generate, seed, **self.params)
+
+    def close(self):
+        if self._executor is not None:
+            # a map being generated can't be cancelled, and exiting would wait for it, so
+            # the worker is stopped instead
+            workers = list((self._executor._processes or {}).values())
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            for worker in workers:
+                worker.terminate()
+            self._executor = None
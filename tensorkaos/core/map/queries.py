@@ -0,0 +1,92 @@
+""" Memoized neighborhood queries over a map.
+
+The map view asks the same questions every frame: which nodes are one or two hops away from
+the current node and can the player move to a clicked node. `MapQueries`
+answers them from a cache keyed on the query and its node, which is dropped whenever the
+graph's version counter moves, so a frame between two edits is only dictionary lookups.
+The zoomed out map, with each integrated module collapsed into one node, is cached the same
+way.
+"""
+
+import numpy as np
+
+from .search import bfs
+
+
+def collapse_modules(graph):
+    """The map with every integrated module collapsed into a single super-node.
+
+    Returns (groups, positions, src, dst): the super-node of every node, the super-nodes'
+    positions, the mean of their members', and the edges between distinct super-nodes, each
+    pair only once. Nodes outside of any module are super-nodes of their own.
+    """
+    module_ids = graph.module_ids
+    loose = -1 - np.arange(len(graph), dtype=np.int64)
+    _, groups = np.unique(
+        np.where(module_ids >= 0, module_ids, loose), return_inverse=True
+    )
+    count = int(groups.max()) + 1 if len(groups) else 0
+
+    members = np.bincount(groups, minlength=count)
+    positions = (
+        np.stack(
+            [
+                np.bincount(groups, weights=graph.positions[:, axis], minlength=count)
+                for axis in range(2)
+            ],
+            axis=1,
+        )
+        / np.maximum(members, 1)[:, None]
+    )
+
+    src, dst = graph.edge_arrays()
+    src, dst = groups[src], groups[dst]
+    keys = np.unique((src * count + dst)[src != dst])
+    return groups, positions.astype(np.float32), keys // count, keys % count
+
+
+class MapQueries:
+    def __init__(self, graph):
+        self.graph = graph
+        self._cache = {}
+        self._version = graph.version
+
+    def _cached(self, key, compute):
+        if self._version != self.graph.version:
+            self._cache.clear()
+            self._version = self.graph.version
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = compute()
+        return value
+
+    def rings(self, node, k):
+        """The nodes exactly 1, 2, ..., k hops away from a node, as a tuple of k arrays."""
+
+        def compute():
+            distance = bfs(self.graph, node, max_depth=k)[0]
+            nodes = np.flatnonzero(distance > 0)
+            order = np.argsort(distance[nodes], kind="stable")
+            bounds = np.searchsorted(distance[nodes][order], np.arange(2, k + 1))
+            rings = tuple(np.split(nodes[order].astype(np.int32), bounds))
+            for ring in rings:
+                ring.setflags(write=False)
+            return rings
+
+        return self._cached(("rings", node, k), compute)
+
+    def successors(self, node):
+        """The set of nodes a node has an edge to."""
+        return self._cached(
+            ("successors", node),
+            lambda: frozenset(self.graph.successors(node).tolist()),
+        )
+
+    def can_move(self, node, other):
+        return other in self.successors(node)
+
+    def collapsed_modules(self):
+        """`collapse_modules` of the graph, the level of detail drawn when zoomed out."""
+        return self._cached(
+            ("collapsed_modules",), lambda: collapse_modules(self.graph)
+        )
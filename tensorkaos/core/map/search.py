@@ -0,0 +1,204 @@
+""" Traversal over the CSR adjacency of a GraphModule. """
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def _bfs(indptr, indices, sources, max_depth):
+    n = len(indptr) - 1
+    distance = np.full(n, -1, dtype=np.int32)
+    parent = np.full(n, -1, dtype=np.int32)
+    queue = np.empty(n, dtype=np.int32)
+    head = 0
+    tail = 0
+    for source in sources:
+        if distance[source] < 0:
+            distance[source] = 0
+            queue[tail] = source
+            tail += 1
+
+    while head < tail:
+        u = queue[head]
+        head += 1
+        if max_depth >= 0 and distance[u] >= max_depth:
+            continue
+        for j in range(indptr[u], indptr[u + 1]):
+            v = indices[j]
+            if distance[v] < 0:
+                distance[v] = distance[u] + 1
+                parent[v] = u
+                queue[tail] = v
+                tail += 1
+
+    return distance, parent
+
+
+def bfs(graph, sources, max_depth=-1, reverse=False):
+    """Breadth first search from one or more sources.
+
+    Returns (distance, parent) arrays over all nodes, -1 where a node was not reached.
+    With `reverse` the search follows incoming edges instead.
+    """
+    indptr, indices = graph.reverse_csr() if reverse else graph.csr()
+    sources = np.atleast_1d(np.asarray(sources, dtype=np.int32))
+    return _bfs(indptr, indices, sources, max_depth)
+
+
+def bfs_distances(graph, source, max_depth=-1, reverse=False):
+    return bfs(graph, source, max_depth, reverse)[0]
+
+
+@njit(cache=True)
+def _tarjan(indptr, indices):
+    n = len(indptr) - 1
+    index = np.full(n, -1, dtype=np.int32)
+    low = np.zeros(n, dtype=np.int32)
+    on_stack = np.zeros(n, dtype=np.bool_)
+    stack = np.empty(n, dtype=np.int32)
+    calls = np.empty(n, dtype=np.int32)
+    next_edge = np.empty(n, dtype=np.int64)
+    component = np.full(n, -1, dtype=np.int32)
+    counter = 0
+    count = 0
+    top = 0
+
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack[top] = root
+        top += 1
+        on_stack[root] = True
+        calls[0] = root
+        next_edge[0] = indptr[root]
+        depth = 1
+
+        while depth > 0:
+            u = calls[depth - 1]
+            j = next_edge[depth - 1]
+            if j < indptr[u + 1]:
+                next_edge[depth - 1] = j + 1
+                v = indices[j]
+                if index[v] < 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack[top] = v
+                    top += 1
+                    on_stack[v] = True
+                    calls[depth] = v
+                    next_edge[depth] = indptr[v]
+                    depth += 1
+                elif on_stack[v]:
+                    low[u] = min(low[u], index[v])
+                continue
+
+            depth -= 1
+            if low[u] == index[u]:
+                while True:
+                    top -= 1
+                    w = stack[top]
+                    on_stack[w] = False
+                    component[w] = count
+                    if w == u:
+                        break
+                count += 1
+            if depth > 0:
+                parent = calls[depth - 1]
+                low[parent] = min(low[parent], low[u])
+
+    return component, count
+
+
+def strongly_connected_components(graph):
+    """Label every node with its strongly connected component, in O(V+E).
+
+    Returns (component, count). Components are numbered in reverse topological order of the
+    condensation, so every edge between two components goes to a lower component id.
+    """
+    return _tarjan(*graph.csr())
+
+
+def condensation(graph):
+    """The condensation DAG of a graph.
+
+    Returns (component, count, source, target) where source/target are the component ids of
+    the edges between different components.
+    """
+    component, count = strongly_connected_components(graph)
+    src, dst = graph.edge_arrays()
+    source, target = component[src], component[dst]
+    between = source != target
+    return component, count, source[between], target[between]
+
+
+def edge_condensation(source, target, count):
+    """The condensation of a graph on `count` nodes given by its edges, like `condensation`."""
+    order = np.argsort(source, kind="stable")
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=count), out=indptr[1:])
+    component, components = _tarjan(indptr, np.asarray(target)[order])
+    source, target = component[source], component[target]
+    between = source != target
+    return component, components, source[between], target[between]
+
+
+@njit(cache=True)
+def _match_sinks(indptr, indices, sources, is_sink):
+    # a depth first search from each source in turn for a sink, never entering a node an
+    # earlier search entered, so no sink is matched twice
+    visited = np.zeros(len(indptr) - 1, dtype=np.bool_)
+    match = np.full(len(sources), -1, dtype=np.int32)
+    stack = np.empty(len(indptr) - 1, dtype=np.int32)
+    next_edge = np.empty(len(indptr) - 1, dtype=np.int64)
+    for i in range(len(sources)):
+        visited[sources[i]] = True
+        stack[0] = sources[i]
+        next_edge[0] = indptr[sources[i]]
+        depth = 1
+        while depth > 0:
+            u = stack[depth - 1]
+            if is_sink[u]:
+                match[i] = u
+                break
+            j = next_edge[depth - 1]
+            if j < indptr[u + 1]:
+                next_edge[depth - 1] = j + 1
+                v = indices[j]
+                if not visited[v]:
+                    visited[v] = True
+                    stack[depth] = v
+                    next_edge[depth] = indptr[v]
+                    depth += 1
+            else:
+                depth -= 1
+    return match
+
+
+def match_sources_to_sinks(source, target, count):
+    """Pair the sources of a DAG with distinct sinks they reach, in O(V+E).
+
+    Returns (sources, sinks, matched): every source and sink, the first `matched` of each
+    paired up in order. The pairing is maximal the way Eswaran and Tarjan's augmentation
+    needs it, every unmatched source reaches a matched sink and every unmatched sink is
+    reached from a matched source.
+    """
+    in_degree = np.bincount(target, minlength=count)
+    out_degree = np.bincount(source, minlength=count)
+    sources = np.flatnonzero(in_degree == 0).astype(np.int32)
+    sinks = np.flatnonzero(out_degree == 0).astype(np.int32)
+
+    order = np.argsort(source, kind="stable")
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(out_degree, out=indptr[1:])
+    match = _match_sinks(indptr, np.asarray(target)[order], sources, out_degree == 0)
+
+    matched = match >= 0
+    unmatched_sinks = np.ones(count, dtype=bool)
+    unmatched_sinks[match[matched]] = False
+    return (
+        np.concatenate((sources[matched], sources[~matched])),
+        np.concatenate((match[matched], sinks[unmatched_sinks[sinks]])),
+        int(np.count_nonzero(matched)),
+    )
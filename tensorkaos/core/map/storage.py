@@ -0,0 +1,165 @@
+""" A compact binary map format and a seed keyed cache of generated maps.
+
+A map file is a small header followed by raw arrays: the node columns, the forward and
+reverse CSR adjacency and the module anchors. The header is a JSON document giving the
+dtype, shape and offset of each array along with the label table and the entry and exit
+nodes. Arrays start on 64 byte boundaries, so loading maps the file copy-on-write and wraps
+each array in place: nothing is read until it is touched and edits never reach the file.
+
+Files are always written to a temporary path and renamed over the destination, so a file
+that is still mapped by a loaded map is never truncated under it.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import numpy as np
+
+from pathlib import Path
+
+from .builders.gamegen import GameGraph
+
+
+MAGIC = b"TKMAP"
+FORMAT_VERSION = 1
+# bump whenever a generator changes the map it makes for a seed, to retire cached maps
+GENERATOR_VERSION = 2
+ALIGNMENT = 64
+
+# magic, format version, header length
+_PREAMBLE = struct.Struct("<5sHI")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_map(path, map):
+    """Write a map to `path` in the binary map format."""
+    indptr, indices = map.csr()
+    reverse_indptr, reverse_indices = map.reverse_csr()
+    arrays = {f"column:{name}": map.column(name) for name in map.NODE_COLUMNS}
+    arrays.update(
+        indptr=indptr,
+        indices=indices,
+        reverse_indptr=reverse_indptr,
+        reverse_indices=reverse_indices,
+        module_anchors=np.asarray(map.module_anchors, dtype=np.int32),
+    )
+
+    header = {
+        "labels": map.labels,
+        "entry_node": None if map.entry_node is None else int(map.entry_node),
+        "exit_node": None if map.exit_node is None else int(map.exit_node),
+        "arrays": {},
+    }
+    # offsets are relative to the end of the header, which is itself aligned
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": array.shape,
+            "offset": offset,
+        }
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(header).encode()
+    start = _aligned(_PREAMBLE.size + len(encoded))
+
+    path = Path(path)
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            file.write(encoded)
+            for name, array in arrays.items():
+                file.seek(start + header["arrays"][name]["offset"])
+                file.write(np.ascontiguousarray(array).tobytes())
+            # pad to the full size, empty arrays at the end still need a valid offset
+            file.truncate(start + offset)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load_map(path, cls=GameGraph):
+    """Load a map written by `save_map`, memory mapping its arrays."""
+    with open(path, "rb") as file:
+        magic, version, length = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"'{path}' is not a version {FORMAT_VERSION} map file.")
+        header = json.loads(file.read(length))
+        start = _aligned(_PREAMBLE.size + length)
+        # the mapping stays open for as long as an array references it
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        arrays[name] = np.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=int(np.prod(shape)),
+            offset=start + spec["offset"],
+        ).reshape(shape)
+
+    columns = {
+        name.partition(":")[2]: array
+        for name, array in arrays.items()
+        if name.startswith("column:")
+    }
+    return cls.from_csr(
+        columns,
+        (arrays["indptr"], arrays["indices"]),
+        (arrays["reverse_indptr"], arrays["reverse_indices"]),
+        header["labels"],
+        arrays["module_anchors"].tolist(),
+        header["entry_node"],
+        header["exit_node"],
+    )
+
+
+def default_cache_path():
+    cache_home = os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "tensorkaos" / "maps"
+
+
+class MapCache:
+    """Generated maps on disk, keyed on the generator, seed and generation parameters.
+
+    Generation has to be deterministic for a key, so a cached map is the map that would be
+    generated, and `GENERATOR_VERSION` retires the maps of older generators. Only the
+    `max_entries` most recently used maps are kept.
+    """
+
+    def __init__(self, path=None, max_entries=64):
+        self.path = Path(path or default_cache_path())
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+    def _file(self, generate, seed, params):
+        name = f"{generate.__module__}.{generate.__qualname__}"
+        key = json.dumps(
+            [FORMAT_VERSION, GENERATOR_VERSION, name, seed, params], sort_keys=True
+        )
+        return self.path / f"{hashlib.sha1(key.encode()).hexdigest()}.tkmap"
+
+    def get(self, generate, seed, **params):
+        """The map `generate(seed, **params)` returns, loaded from the cache if it is there."""
+        file = self._file(generate, seed, params)
+        if file.exists():
+            file.touch()
+            return load_map(file)
+
+        map = generate(seed, **params)
+        save_map(file, map)
+        self._prune()
+        return map
+
+    def _prune(self):
+        files = sorted(self.path.glob("*.tkmap"), key=lambda file: file.stat().st_mtime)
+        for file in files[: max(len(files) - self.max_entries, 0)]:
+            file.unlink(missing_ok=True)
@@ -0,0 +1,287 @@
+""" A streaming world made of square map chunks.
+
+Only the chunks around the player are kept in memory, stitched together into a single
+GameGraph. Chunks that fall out of range are written back to a ChunkStore on disk once the
+resident set grows past its memory budget, least recently used first, and are loaded again
+(or generated, if they were never visited) when the player comes back.
+
+Nodes are identified across evictions by a stable id packing their chunk key with their local
+id in the chunk. Local ids never change: a chunk's generated nodes come first and nodes added
+by lazy module expansion are appended in creation order. The border ports of a chunk are its
+first local ids, so the edges between neighbouring chunks are rebuilt from the chunk keys.
+
+Each resident chunk keeps the ids its local ids have in the stitched graph. Expanded nodes are
+appended to the end of the graph, not to their chunk's range, and are added to that index as
+they show up. The world observes the graph to know which chunks were edited, and only those
+are cut out of it again before chunks are stored.
+"""
+
+import logging
+import random
+import tempfile
+import numpy as np
+
+from collections import OrderedDict
+from pathlib import Path
+
+from .builders.gamegen import GameGraph
+from .builders.lazy import MODULE_KINDS, mark_stub
+from .storage import load_map, save_map
+from ...utilities.misc import derive_seed
+
+log = logging.getLogger(__name__)
+
+
+# local ids of the border ports, every chunk starts with them
+WEST, EAST, SOUTH, NORTH = range(4)
+PORTS = ("West", "East", "South", "North")
+HUB = len(PORTS)
+
+
+def stable_id(key, local):
+    cx, cy = key
+    return ((cx & 0xFFFF) << 48) | ((cy & 0xFFFF) << 32) | local
+
+
+def split_stable_id(stable):
+    cx, cy = (stable >> 48) & 0xFFFF, (stable >> 32) & 0xFFFF
+    # sign extend the 16 bit chunk coordinates
+    cx, cy = (c - 0x10000 if c & 0x8000 else c for c in (cx, cy))
+    return (cx, cy), stable & 0xFFFFFFFF
+
+
+def generate_chunk(seed, key, size):
+    """Generate the chunk at `key`: four border ports joined to a central hub by module stubs."""
+    cx, cy = key
+    rng = random.Random(derive_seed(seed, cx, cy))
+    origin = np.array([cx * size, cy * size], dtype=np.float32)
+    half, last = size / 2, size - 1
+
+    chunk = GameGraph()
+    ports = [
+        chunk.add_node(label, origin + offset)
+        for label, offset in zip(
+            PORTS, [(0, half), (last, half), (half, 0), (half, last)]
+        )
+    ]
+    hub = chunk.add_node("Hub", origin + half)
+    for port in ports:
+        path = chunk.add_node(
+            "Path", (chunk.positions[port] + chunk.positions[hub]) / 2
+        )
+        chunk.add_edges_from([(port, path), (path, hub), (hub, port)])
+        mark_stub(chunk, path, rng.choice(MODULE_KINDS), rng.getrandbits(64))
+
+    chunk.set_entry_exit(hub, hub)
+    return chunk
+
+
+class ChunkStore:
+    """Evicted chunks, one map file per chunk in a local directory.
+
+    Without a path the chunks go to a temporary directory, deleted by `close`.
+    """
+
+    def __init__(self, path=None):
+        self._temporary = None
+        if path is None:
+            self._temporary = tempfile.TemporaryDirectory(prefix="tensorkaos-chunks-")
+            path = self._temporary.name
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def close(self):
+        if self._temporary is not None:
+            self._temporary.cleanup()
+            self._temporary = None
+
+    def _file(self, key):
+        return self.path / f"{key[0]}_{key[1]}.tkmap"
+
+    def __contains__(self, key):
+        return self._file(key).exists()
+
+    def save(self, key, chunk):
+        save_map(self._file(key), chunk)
+
+    def load(self, key):
+        return load_map(self._file(key))
+
+
+class ChunkedWorld:
+    """Streams map chunks in and out around the player, keeping memory use bounded."""
+
+    def __init__(
+        self,
+        seed,
+        chunk_size=12,
+        load_radius=1,
+        memory_budget=1 << 20,
+        store=None,
+    ):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.load_radius = load_radius
+        self.memory_budget = memory_budget
+        self._owns_store = store is None
+        self.store = store or ChunkStore()
+
+        # resident chunks, least recently used first
+        self.resident = OrderedDict()
+
+        # the stitched graph of all resident chunks
+        self.graph = None
+        self._keys = []
+        self._globals = {}  # chunk key -> the graph id of each local id
+        self._node_locals = np.zeros(0, dtype=np.int32)
+        self._indexed = 0  # graph nodes with a local id so far
+        self._dirty = set()  # chunks of the graph edited since they were last split
+
+    def update(self, node=None):
+        """Make the chunks around `node` resident, by default around the origin chunk's hub.
+
+        Returns the id of the same node in `self.graph`, which is rebuilt when chunks are
+        loaded or evicted.
+        """
+        if node is None:
+            stable = stable_id((0, 0), HUB)
+        else:
+            stable = self.stable_id(node)
+        (cx, cy), _ = split_stable_id(stable)
+
+        r = self.load_radius
+        wanted = [
+            (cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1)
+        ]
+        for key in wanted:
+            if key in self.resident:
+                self.resident.move_to_end(key)
+
+        missing = [key for key in wanted if key not in self.resident]
+        if not missing:
+            return node
+
+        self._split()
+        for key in missing:
+            if key in self.store:
+                self.resident[key] = self.store.load(key)
+            else:
+                self.resident[key] = generate_chunk(self.seed, key, self.chunk_size)
+        self._evict(keep=set(wanted))
+        self._stitch(center=(cx, cy))
+
+        return self.node_of(stable)
+
+    def stable_id(self, node):
+        self._index()
+        chunk = self.graph.column("regions")[node]
+        return stable_id(self._keys[chunk], int(self._node_locals[node]))
+
+    def node_of(self, stable):
+        """The id in `self.graph` of a node given by its stable id, None if not resident."""
+        self._index()
+        key, local = split_stable_id(stable)
+        nodes = self._globals.get(key)
+        if nodes is None or local >= len(nodes):
+            return None
+        return int(nodes[local])
+
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunk in self.resident.values())
+
+    def close(self):
+        """Close the chunk store, if the world made it."""
+        if self._owns_store:
+            self.store.close()
+
+    def _evict(self, keep):
+        nbytes = self.nbytes
+        for key in list(self.resident):
+            if nbytes <= self.memory_budget:
+                break
+            if key not in keep:
+                log.debug(f"Evicting chunk {key}")
+                chunk = self.resident.pop(key)
+                nbytes -= chunk.nbytes
+                self.store.save(key, chunk)
+
+    def _stitch(self, center):
+        """Rebuild the stitched graph from the resident chunks, entered at the center chunk's hub."""
+        if self.graph is not None:
+            self.graph.observers.remove(self._on_edit)
+        graph = GameGraph(capacity=sum(len(chunk) for chunk in self.resident.values()))
+        self._keys = list(self.resident)
+        offsets = {}
+        self._globals = {}
+        for key, chunk in self.resident.items():
+            offsets[key] = int(graph.add_disjoint(chunk)[0])
+            self._globals[key] = np.arange(
+                offsets[key], offsets[key] + len(chunk), dtype=np.int32
+            )
+
+        # connect the facing ports of neighbouring chunks
+        edges = []
+        for (cx, cy), offset in offsets.items():
+            for (dx, dy), port, facing in (
+                ((1, 0), EAST, WEST),
+                ((0, 1), NORTH, SOUTH),
+            ):
+                other = offsets.get((cx + dx, cy + dy))
+                if other is not None:
+                    edges += [
+                        (offset + port, other + facing),
+                        (other + facing, offset + port),
+                    ]
+        graph.add_edges_from(edges)
+
+        sizes = [len(chunk) for chunk in self.resident.values()]
+        graph.column("regions")[:] = np.repeat(
+            np.arange(len(sizes), dtype=np.int32), sizes
+        )
+        self._node_locals = np.concatenate(
+            [np.arange(size, dtype=np.int32) for size in sizes]
+        )
+
+        hub = offsets[center] + HUB
+        graph.set_entry_exit(hub, hub)
+        graph.observers.append(self._on_edit)
+        self.graph = graph
+        self._indexed = len(graph)
+        self._dirty.clear()
+
+    def _on_edit(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        chunks = self.graph.column("regions")[nodes]
+        self._dirty.update(np.unique(chunks[chunks >= 0]).tolist())
+
+    def _index(self):
+        """Give the nodes added to the graph since the last call their local ids."""
+        graph = self.graph
+        if graph is None or self._indexed == len(graph):
+            return
+        new = np.arange(self._indexed, len(graph), dtype=np.int32)
+        locals_ = np.empty(len(graph), dtype=np.int32)
+        locals_[: self._indexed] = self._node_locals[: self._indexed]
+        # nodes added by module expansion inherit the region, i.e. chunk, of the stub, and
+        # are appended to it in creation order
+        chunks = graph.column("regions")[new]
+        for chunk in np.unique(chunks).tolist():
+            nodes = new[chunks == chunk]
+            key = self._keys[chunk]
+            locals_[nodes] = np.arange(
+                len(self._globals[key]), len(self._globals[key]) + len(nodes)
+            )
+            self._globals[key] = np.concatenate((self._globals[key], nodes))
+        self._node_locals = locals_
+        self._indexed = len(graph)
+
+    def _split(self):
+        """Write edits made to the stitched graph back into the chunks they were made in."""
+        self._index()
+        for chunk in sorted(self._dirty):
+            key = self._keys[chunk]
+            resident = self.graph.subgraph(self._globals[key])
+            resident.set_entry_exit(HUB, HUB)
+            self.resident[key] = resident
+        self._dirty.clear()
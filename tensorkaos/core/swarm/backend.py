@@ -0,0 +1,119 @@
+""" The interface shared by the boid swarm simulation backends.
+
+A swarm is two flat float32 arrays: positions, (n, 2) in pixels, and angles, (n,) headings
+in radians. They have the same layout as the position and angle storage buffers of the
+compute shader, so a step's results can be written to sprites or uploaded to a GPU buffer
+without any conversion, whichever backend produced them.
+
+Backends keep two copies of that state and ping-pong between them: a step reads one and
+writes the other. `step_async` starts a step, on a worker thread or as a GPU dispatch, and
+returns at once, so a frame can be drawn from the current state while the next one is
+computed. `wait` is the fence: it blocks until that step is done and makes its results
+current, without copying them.
+"""
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from ...utilities.misc import setup_logging
+
+log = setup_logging(__name__)
+
+
+@dataclass
+class SwarmParams:
+    speed: float = 100.0  # pixels per second
+    turn_rate: float = 4.0  # radians per second
+    neighbor_radius: float = 40.0  # boids closer than this flock together
+    separation_radius: float = 15.0  # and closer than this push apart
+    seek_weight: float = 1.0
+    separation_weight: float = 1.5
+    alignment_weight: float = 0.8
+    cohesion_weight: float = 0.6
+
+
+class SwarmBackend:
+    """Steps a swarm of boids towards a target.
+
+    `positions` and `angles` are the swarm's current state, read only views which are valid
+    until the next `wait`.
+
+    `periods`, an int32 array with one entry per boid or None for all ones, is how many steps
+    apart each boid steers, see `lod.UpdateTiers`. It is read when a step starts, so only
+    replace it between `wait` and `step_async`. Backends for which steering is cheap enough
+    may ignore it.
+    """
+
+    def __init__(self, positions, angles, params=None):
+        self.params = SwarmParams() if params is None else params
+        self.count = len(positions)
+        self.periods = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def positions(self):
+        raise NotImplementedError
+
+    @property
+    def angles(self):
+        raise NotImplementedError
+
+    def step(self, delta_time, target):
+        """Advance the swarm by `delta_time` seconds, seeking the (x, y) `target`."""
+        self.step_async(delta_time, target)
+        self.wait()
+
+    def step_async(self, delta_time, target):
+        """Start a step, the current state doesn't change until `wait`."""
+        raise NotImplementedError
+
+    def wait(self):
+        """Block until the step started last is done and make it current, if there is one."""
+        raise NotImplementedError
+
+    def reset(self, positions, angles):
+        """Start over from new positions and angles, as many as before, in place."""
+        raise NotImplementedError
+
+    def close(self):
+        self.wait()
+
+
+def swarm_arrays(positions, angles):
+    """Positions and angles in the backends' layout, contiguous float32 copies."""
+    positions = np.array(positions, dtype=np.float32).reshape(-1, 2)
+    angles = np.array(angles, dtype=np.float32).reshape(-1)
+    if len(positions) != len(angles):
+        raise ValueError(f"{len(positions)} positions but {len(angles)} angles.")
+    return positions, angles
+
+
+def create_swarm(positions, angles, params=None, ctx=None, backend=None):
+    """A swarm on the CPU, or on the GPU when `backend` is "gpu".
+
+    `backend` defaults to the SWARM_BACKEND environment variable, then "cpu". The GPU
+    backend, which needs a `ctx` that can run compute shaders, seeks the target without
+    flocking, so it is only used when asked for, and falls back to the CPU without one.
+    """
+    backend = backend or os.getenv("SWARM_BACKEND") or "cpu"
+    if backend == "gpu" and (ctx is None or ctx.gl_version < (4, 3)):
+        found = "no context" if ctx is None else "OpenGL %d.%d" % ctx.gl_version
+        log.warning(
+            f"The GPU swarm needs OpenGL 4.3 compute shaders but there is {found},"
+            " simulating on the CPU instead"
+        )
+        backend = "cpu"
+
+    if backend == "cpu":
+        from .cpu import CpuSwarm
+
+        return CpuSwarm(positions, angles, params)
+    elif backend == "gpu":
+        from .gpu import ComputeSwarm
+
+        return ComputeSwarm(ctx, positions, angles, params)
+    raise ValueError(f"Unknown swarm backend '{backend}'.")
@@ -0,0 +1,190 @@
+""" A uniform grid cell list for swarm neighbor queries, rebuilt every step in O(n).
+
+Agents are bucketed into square cells over the bounding box of the swarm, numbered row by
+row, and sorted by cell with a counting sort: one pass to count, one prefix sum, one pass to
+scatter. Their positions are gathered in that order, so the agents of a cell, and of a run
+of cells along a row, are contiguous. A query around a point reads one contiguous range per
+row of cells it overlaps.
+
+When the swarm spreads far apart the cells grow, so there are never many more cells than
+agents. The jitted helpers take the cell list's arrays rather than the object, for use
+inside other kernels, see `cpu._step`.
+"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, inline="always")
+def _floor(value):
+    # np.floor and a cast, much cheaper than // on floats with its Python semantics
+    return np.int64(np.floor(value))
+
+
+@njit(cache=True, inline="always")
+def cell_of(px, py, origin, cell_size, shape):
+    """The (x, y) cell of a point inside the grid."""
+    x = min(_floor((px - origin[0]) / cell_size), shape[0] - 1)
+    y = min(_floor((py - origin[1]) / cell_size), shape[1] - 1)
+    return x, y
+
+
+@njit(cache=True, nogil=True)
+def _bounds(positions):
+    # a single pass, numpy's min and max along the first axis are strided and much slower
+    low = positions[0].copy()
+    high = positions[0].copy()
+    for i in range(1, len(positions)):
+        for axis in range(2):
+            low[axis] = min(low[axis], positions[i, axis])
+            high[axis] = max(high[axis], positions[i, axis])
+    return low, high
+
+
+@njit(cache=True, nogil=True)
+def _build(positions, origin, cell_size, shape, keys, fill, starts, order, sorted_pos):
+    n = len(positions)
+    starts[:] = 0
+    for i in range(n):
+        x, y = cell_of(positions[i, 0], positions[i, 1], origin, cell_size, shape)
+        keys[i] = x * shape[1] + y
+        starts[keys[i] + 1] += 1
+    for cell in range(1, len(starts)):
+        starts[cell] += starts[cell - 1]
+
+    fill[:] = starts[:-1]
+    for i in range(n):
+        k = fill[keys[i]]
+        fill[keys[i]] += 1
+        order[k] = i
+        sorted_pos[k, 0], sorted_pos[k, 1] = positions[i, 0], positions[i, 1]
+
+
+@njit(cache=True, inline="always")
+def row_range(starts, shape, x, low_y, high_y):
+    """The sorted slots of the agents in cells (x, low_y) to (x, high_y), clipped."""
+    if x < 0 or x >= shape[0]:
+        return 0, 0
+    low_y, high_y = max(low_y, 0), min(high_y, shape[1] - 1)
+    if low_y > high_y:
+        return 0, 0
+    return starts[x * shape[1] + low_y], starts[x * shape[1] + high_y + 1]
+
+
+@njit(cache=True)
+def _query(px, py, radius, origin, cell_size, shape, starts, sorted_pos, out):
+    """Write the sorted slots of the agents within `radius` of a point to `out`."""
+    low_x = _floor((px - radius - origin[0]) / cell_size)
+    high_x = _floor((px + radius - origin[0]) / cell_size)
+    low_y = _floor((py - radius - origin[1]) / cell_size)
+    high_y = _floor((py + radius - origin[1]) / cell_size)
+    r2 = radius * radius
+    count = 0
+    for x in range(max(low_x, 0), min(high_x, shape[0] - 1) + 1):
+        start, end = row_range(starts, shape, x, low_y, high_y)
+        for k in range(start, end):
+            dx, dy = sorted_pos[k, 0] - px, sorted_pos[k, 1] - py
+            if dx * dx + dy * dy <= r2:
+                out[count] = k
+                count += 1
+    return count
+
+
+class CellList:
+    def __init__(self, cell_size):
+        self.min_cell_size = float(cell_size)
+        self.cell_size = np.float32(cell_size)
+        self.origin = np.zeros(2, dtype=np.float32)
+        self.shape = np.ones(2, dtype=np.int64)
+        self.count = 0
+        self._allocate(0, 1)
+
+    def _allocate(self, capacity, cells):
+        self.capacity = capacity
+        self._keys = np.empty(capacity, dtype=np.int64)
+        self._fill = np.empty(cells, dtype=np.int64)
+        # starts[c]:starts[c + 1] are the sorted slots of cell c
+        self.starts = np.zeros(cells + 1, dtype=np.int64)
+        # order[k] is the agent in sorted slot k, whose position is sorted_positions[k]
+        self.order = np.empty(capacity, dtype=np.int64)
+        self.sorted_positions = np.empty((capacity, 2), dtype=np.float32)
+
+    def build(self, positions):
+        """Bucket (n, 2) positions, reusing the arrays of the last build if they fit."""
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 2)
+        n = self.count = len(positions)
+        if not n:
+            return self
+
+        self.origin, high = _bounds(positions)
+        extent = high - self.origin
+        # at most about four cells per agent
+        cell_size = max(
+            self.min_cell_size, float(np.sqrt(extent[0] * extent[1] / (4 * n)))
+        )
+        self.cell_size = np.float32(cell_size)
+        self.shape = (extent // self.cell_size).astype(np.int64) + 1
+        cells = int(self.shape[0] * self.shape[1])
+        if n > self.capacity or cells >= len(self.starts):
+            self._allocate(
+                max(n, self.capacity), max(cells, 2 * (len(self.starts) - 1))
+            )
+
+        _build(
+            positions,
+            self.origin,
+            self.cell_size,
+            self.shape,
+            self._keys[:n],
+            self._fill[:cells],
+            self.starts[: cells + 1],
+            self.order[:n],
+            self.sorted_positions[:n],
+        )
+        return self
+
+    def query(self, point, radius):
+        """Ids of the agents within `radius` of a point, in no particular order."""
+        out = np.empty(self.count, dtype=np.int64)
+        count = _query(
+            np.float32(point[0]),
+            np.float32(point[1]),
+            np.float32(radius),
+            self.origin,
+            self.cell_size,
+            self.shape,
+            self.starts,
+            self.sorted_positions,
+            out,
+        )
+        return self.order[out[:count]]
+
+
+if __name__ == "__main__":
+    import time
+
+    # benchmark, rebuilding the cell list at growing swarm sizes against an argsort
+    rng = np.random.default_rng(0)
+    cells = CellList(40.0)
+    for size in (10_000, 100_000, 1_000_000):
+        side = np.sqrt(size * np.pi * 40.0**2 / 10)
+        positions = rng.uniform(0, side, (size, 2)).astype(np.float32)
+        cells.build(positions)  # compile and allocate
+        start = time.perf_counter()
+        for _ in range(10):
+            cells.build(positions)
+        elapsed = (time.perf_counter() - start) / 10
+
+        start = time.perf_counter()
+        keys = (positions // 40.0).astype(np.int64) @ np.array([1 << 32, 1])
+        np.argsort(keys, kind="stable")
+        argsort = time.perf_counter() - start
+        print(
+            f"{size:>9} agents: rebuilt in {elapsed * 1000:7.2f}ms,"
+            f" an argsort of their cells takes {argsort * 1000:7.2f}ms"
+        )
+
+    for point in rng.uniform(0, side, (100, 2)):
+        brute = np.flatnonzero(np.linalg.norm(positions - point, axis=1) <= 55)
+        assert np.array_equal(np.sort(cells.query(point, 55)), brute)
+    print("Radius queries match a brute force scan.")
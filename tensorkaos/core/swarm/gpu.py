@@ -0,0 +1,221 @@
+""" The swarm step as a compute shader, for contexts with OpenGL 4.3 or later.
+
+Positions and angles live in two pairs of storage buffers. A step reads one pair, bound to
+0 and 1, and writes the other, bound to 2 and 3, as `swarm_target.glsl` expects; the
+current pair can be drawn from directly. An asynchronous step only queues the dispatch and a
+fence, `wait` blocks on the fence, usually long signaled by then, and flips the pairs.
+Reading them back to numpy arrays is only needed to feed sprites, and is done lazily, once
+per step.
+
+The shader turns towards the target at the swarm's turn rate, like the CPU backend, but
+leaves out the flocking terms, which need neighbors; `create_swarm` only picks it when asked
+to. Seeking is cheap enough that every boid steers every step, `periods` is ignored.
+"""
+
+import ctypes
+
+import numpy as np
+from pyglet import gl
+
+from ...utilities.misc import get_assets_path
+from .backend import SwarmBackend, swarm_arrays
+
+# invocations per work group, local_size_x in the shader
+GROUP_SIZE = 256
+
+_sync_functions = None
+
+
+def _sync():
+    """glFenceSync, glClientWaitSync and glDeleteSync, which pyglet doesn't bind."""
+    global _sync_functions
+    if _sync_functions is None:
+        # imported here, importing pyglet.gl's modules opens a window unless arcade did
+        from pyglet.gl import lib
+
+        _sync_functions = (
+            lib.link_GL("glFenceSync", ctypes.c_void_p, [gl.GLenum, gl.GLbitfield]),
+            lib.link_GL(
+                "glClientWaitSync",
+                gl.GLenum,
+                [ctypes.c_void_p, gl.GLbitfield, gl.GLuint64],
+            ),
+            lib.link_GL("glDeleteSync", None, [ctypes.c_void_p]),
+        )
+    return _sync_functions
+
+
+class Fence:
+    """A GL sync object, signaled once the commands issued before it are done."""
+
+    def __init__(self):
+        fence_sync, _, _ = _sync()
+        self._sync = fence_sync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def wait(self, timeout=1.0):
+        _, client_wait_sync, delete_sync = _sync()
+        # the first wait flushes the commands, or the fence might never be reached
+        flags = gl.GL_SYNC_FLUSH_COMMANDS_BIT
+        while True:
+            status = client_wait_sync(self._sync, flags, int(timeout * 1e9))
+            if status != gl.GL_TIMEOUT_EXPIRED:
+                break
+            flags = 0
+        delete_sync(self._sync)
+        if status == gl.GL_WAIT_FAILED:
+            raise RuntimeError("Waiting for a GL fence failed.")
+
+
+class ComputeSwarm(SwarmBackend):
+    def __init__(self, ctx, positions, angles, params=None):
+        super().__init__(positions, angles, params)
+        self.ctx = ctx
+        source = get_assets_path() / "shaders" / "compute" / "swarm_target.glsl"
+        self.shader = ctx.compute_shader(source=source.read_text())
+
+        positions, angles = swarm_arrays(positions, angles)
+        # empty buffers can't be bound, keep at least one entity worth of space
+        self._buffers = [
+            (
+                ctx.buffer(reserve=max(positions.nbytes, 8)),
+                ctx.buffer(reserve=max(angles.nbytes, 4)),
+            )
+            for _ in range(2)
+        ]
+        self._front = 0
+        if self.count:
+            self.position_buffer.write(positions)
+            self.angle_buffer.write(angles)
+        self._positions, self._angles = positions, angles
+        self._stale = False
+        self._fence = None
+
+    @property
+    def position_buffer(self):
+        return self._buffers[self._front][0]
+
+    @property
+    def angle_buffer(self):
+        return self._buffers[self._front][1]
+
+    @property
+    def positions(self):
+        self._read_back()
+        return self._positions
+
+    @property
+    def angles(self):
+        self._read_back()
+        return self._angles
+
+    def step_async(self, delta_time, target):
+        self.wait()
+        if not self.count:
+            return
+        for binding, buffer in enumerate(
+            self._buffers[self._front] + self._buffers[1 - self._front]
+        ):
+            buffer.bind_to_storage_buffer(binding=binding)
+        self.shader["targetPos"] = tuple(float(value) for value in target)
+        self.shader["deltaTime"] = delta_time
+        self.shader["speed"] = self.params.speed
+        self.shader["turnRate"] = self.params.turn_rate
+        self.shader["count"] = self.count
+        self.shader.run(group_x=(self.count + GROUP_SIZE - 1) // GROUP_SIZE)
+        # later reads of the buffers, by the CPU or as vertex attributes, see the writes
+        gl.glMemoryBarrier(
+            gl.GL_SHADER_STORAGE_BARRIER_BIT
+            | gl.GL_BUFFER_UPDATE_BARRIER_BIT
+            | gl.GL_VERTEX_ATTRIB_ARRAY_BARRIER_BIT
+        )
+        self._fence = Fence()
+
+    def wait(self):
+        if self._fence is None:
+            return
+        fence, self._fence = self._fence, None
+        fence.wait()
+        self._front = 1 - self._front
+        self._stale = True
+
+    def reset(self, positions, angles):
+        self.wait()
+        positions, angles = swarm_arrays(positions, angles)
+        if len(positions) != self.count:
+            raise ValueError(
+                f"A swarm of {self.count} boids can't be reset to {len(positions)}."
+            )
+        if self.count:
+            self.position_buffer.write(positions)
+            self.angle_buffer.write(angles)
+        self._positions, self._angles = positions, angles
+        self._stale = False
+
+    def _read_back(self):
+        if not self._stale:
+            return
+        self._positions = np.frombuffer(
+            self.position_buffer.read(size=self.count * 8), dtype=np.float32
+        ).reshape(-1, 2)
+        self._angles = np.frombuffer(
+            self.angle_buffer.read(size=self.count * 4), dtype=np.float32
+        )
+        self._stale = False
+
+    def close(self):
+        super().close()
+        for buffers in self._buffers:
+            for buffer in buffers:
+                buffer.delete()
+
+
+if __name__ == "__main__":
+    import time
+
+    import arcade
+
+    from .backend import SwarmParams
+
+    # benchmark, steps per second at growing swarm sizes, and the seeking step checked
+    # against the CPU backend with its flocking terms turned off, turning at the same rate
+    window = arcade.Window(100, 100, visible=False, gl_version=(4, 3))
+    rng = np.random.default_rng(0)
+    for size in (10_000, 100_000, 1_000_000):
+        swarm = ComputeSwarm(
+            window.ctx,
+            rng.uniform(0, 1000, (size, 2)),
+            rng.uniform(-np.pi, np.pi, size),
+        )
+        swarm.step(1 / 60, (500, 500))
+        swarm.positions
+        steps = max(3, 1_000_000 // size)
+        start = time.perf_counter()
+        for _ in range(steps):
+            swarm.step(1 / 60, (500, 500))
+        window.ctx.finish()
+        elapsed = (time.perf_counter() - start) / steps
+        start = time.perf_counter()
+        swarm.positions
+        read_back = time.perf_counter() - start
+        print(
+            f"{size:>9} boids: {elapsed * 1000:8.2f}ms per step,"
+            f" {size / elapsed / 1e6:.1f}M boid updates per second,"
+            f" {read_back * 1000:.2f}ms to read back"
+        )
+        swarm.close()
+
+    from .cpu import CpuSwarm
+
+    params = SwarmParams(separation_weight=0, alignment_weight=0, cohesion_weight=0)
+    positions = rng.uniform(0, 1000, (1000, 2))
+    angles = rng.uniform(-np.pi, np.pi, 1000)
+    gpu = ComputeSwarm(window.ctx, positions, angles, params)
+    cpu = CpuSwarm(positions, angles, params)
+    for _ in range(60):
+        gpu.step(1 / 60, (500, 500))
+        cpu.step(1 / 60, (500, 500))
+    # a boid half a turn away from the target turns either way depending on rounding,
+    # the odd one which passes the target and turns around can end up elsewhere
+    same = np.all(np.abs(gpu.positions - cpu.positions) < 1e-2, axis=1)
+    assert np.mean(same) > 0.99
+    print("The GPU and CPU backends seek and turn towards the target alike.")
@@ -0,0 +1,140 @@
+""" Level of detail for swarms: how often each boid steers, within a budget per step.
+
+Boids are ranked by their distance to a focus, the target or the player, with boids off
+screen counted as several times further away than they are. The nearest ones steer every
+step, further ones every 2nd, 4th, ... step in tiers, and move straight on in between, see
+`cpu._step`.
+
+Tiers are assigned without sorting: distances are bucketed into a histogram, and each bucket
+goes to the first tier which still has room for every boid up to and including it. Tiers
+are sized so each costs the same share of `budget` steering updates per step, and when the
+swarm is too big for that the last tier's period is stretched until it fits, so a step
+costs about the same however many boids there are.
+"""
+
+import numpy as np
+
+
+class UpdateTiers:
+    def __init__(
+        self, budget=20_000, periods=(1, 2, 4, 8), interval=15, hidden_factor=4.0
+    ):
+        self.budget = budget  # Boids steering per step, at most
+        self.periods = periods  # Steps between steering, tier by tier
+        self.interval = interval  # Steps between rebalancing
+        self.hidden_factor = hidden_factor  # How much further off screen boids count as
+        self.buckets = 1024
+        # boids per tier, as of the last rebalancing
+        self.counts = np.zeros(len(periods), dtype=np.int64)
+        self.last_period = periods[-1]  # The last tier's period, stretched or not
+        self._countdown = 0
+
+    def assign(self, positions, focus, view=None):
+        """The update period of every boid, nearest `focus` first, within the budget.
+
+        `view` is the visible (left, bottom, right, top) rectangle, if any.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 2)
+        if len(positions) <= self.budget:
+            self.counts[:] = 0
+            self.counts[0] = len(positions)
+            return np.ones(len(positions), dtype=np.int32)
+
+        offset = positions - np.asarray(focus, dtype=np.float32)
+        distance = np.sqrt(np.einsum("ij,ij->i", offset, offset))
+        if view is not None:
+            left, bottom, right, top = view
+            x, y = positions[:, 0], positions[:, 1]
+            hidden = (x < left) | (x > right) | (y < bottom) | (y > top)
+            distance[hidden] *= self.hidden_factor
+
+        low, high = distance.min(), distance.max()
+        scale = self.buckets / max(high - low, 1e-6)
+        buckets = np.minimum(
+            ((distance - low) * scale).astype(np.int64), self.buckets - 1
+        )
+        counts = np.bincount(buckets, minlength=self.buckets)
+
+        periods = np.asarray(self.periods, dtype=np.int32)
+        share = self.budget / len(periods)
+        # the boids the tiers before the last can take, each costing `share` per step
+        capacity = np.cumsum(share * periods[:-1])
+        bucket_tier = np.searchsorted(capacity, np.cumsum(counts), side="left")
+        self.counts = np.bincount(bucket_tier, weights=counts, minlength=len(periods))
+        self.counts = self.counts.astype(np.int64)
+
+        spent = np.sum(self.counts[:-1] / periods[:-1])
+        left_over = max(self.budget - spent, 1.0)
+        self.last_period = max(
+            int(periods[-1]), int(np.ceil(self.counts[-1] / left_over))
+        )
+        periods[-1] = self.last_period
+        return periods[bucket_tier[buckets]]
+
+    def update(self, swarm, focus, view=None):
+        """Rebalance a swarm's periods every `interval` calls, call between its steps."""
+        if self._countdown <= 0:
+            swarm.periods = self.assign(swarm.positions, focus, view)
+            self._countdown = self.interval
+        self._countdown -= 1
+
+
+if __name__ == "__main__":
+    import time
+
+    from .backend import SwarmParams
+    from .cpu import CpuSwarm
+
+    # benchmark, steps of a growing swarm with and without tiers, with about 10 neighbors
+    # per boid and the view a quarter of the area around the target
+    rng = np.random.default_rng(0)
+    params = SwarmParams()
+    tiers = UpdateTiers(budget=20_000)
+    for size in (10_000, 100_000, 1_000_000):
+        side = np.sqrt(size * np.pi * params.neighbor_radius**2 / 10)
+        positions = rng.uniform(0, side, (size, 2))
+        angles = rng.uniform(-np.pi, np.pi, size)
+        target = (side / 2, side / 2)
+        view = (side / 4, side / 4, 3 * side / 4, 3 * side / 4)
+        for tiered in (False, True):
+            swarm = CpuSwarm(positions, angles, params)
+            if tiered:
+                swarm.periods = tiers.assign(swarm.positions, target, view)
+            swarm.step(1 / 60, target)  # compile
+            steps = max(3, 300_000 // size)
+            start = time.perf_counter()
+            for _ in range(steps):
+                swarm.step(1 / 60, target)
+            elapsed = (time.perf_counter() - start) / steps
+            steering = size if swarm.periods is None else np.sum(1 / swarm.periods)
+            print(
+                f"{size:>9} boids, {'tiered' if tiered else 'all   '}:"
+                f" {elapsed * 1000:8.2f}ms per step, {steering:9.0f} steering per step"
+            )
+            swarm.close()
+
+    start = time.perf_counter()
+    periods = tiers.assign(swarm.positions, target, view)
+    print(
+        f"Rebalanced {size} boids in {(time.perf_counter() - start) * 1000:.2f}ms,"
+        f" {tiers.counts.tolist()} per tier, the last every {tiers.last_period} steps."
+    )
+
+    # within budget, nearest first, and a step with every boid in the first tier is a full one
+    ids = np.arange(size)
+    steering = [
+        np.count_nonzero((tick + ids) % periods == 0)
+        for tick in range(tiers.last_period)
+    ]
+    assert np.mean(steering) <= tiers.budget * 1.01
+    distance = np.linalg.norm(swarm.positions - target, axis=1)
+    visible = np.all((swarm.positions >= view[:2]) & (swarm.positions <= view[2:]), 1)
+    near, far = visible & (periods == 1), visible & (periods > 1)
+    assert distance[near].max() <= distance[far].min()
+    full, tiered = CpuSwarm(positions, angles), CpuSwarm(positions, angles)
+    tiered.periods = np.ones(size, dtype=np.int32)
+    for _ in range(3):
+        full.step(1 / 60, target)
+        tiered.step(1 / 60, target)
+    assert np.array_equal(full.positions, tiered.positions)
+    print("Tiers stay within budget, nearest first, and period one is a full step.")
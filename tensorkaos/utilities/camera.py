@@ -0,0 +1,50 @@
+""" A 2D camera mapping world positions to screen pixels in one vectorized transform.
+
+    screen = (world - focus) * scale * zoom + pan
+
+`scale` converts world units to pixels, `zoom` is the user controlled magnification, `focus`
+is the world point kept at the `pan` screen point. The same transform is used to draw, as a
+uniform, and to pick, on arrays of positions.
+"""
+
+import numpy as np
+
+
+class Camera2D:
+    def __init__(self, scale=1.0, pan=(0, 0), zoom=1.0, min_zoom=0.1, max_zoom=10.0):
+        self.scale = scale
+        self.zoom = zoom
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.pan = np.array(pan, dtype=np.float32)
+        self.focus = np.zeros(2, dtype=np.float32)
+
+    @property
+    def pixels_per_unit(self):
+        return self.scale * self.zoom
+
+    @property
+    def offset(self):
+        """Screen position of the world origin, the translation part of the transform."""
+        return self.pan - self.focus * self.pixels_per_unit
+
+    def to_screen(self, positions):
+        """Transform (n, 2) world positions to screen pixels."""
+        return (
+            np.asarray(positions, dtype=np.float32) * self.pixels_per_unit + self.offset
+        )
+
+    def to_world(self, points):
+        """Transform (n, 2) screen pixels back to world positions."""
+        return (
+            np.asarray(points, dtype=np.float32) - self.offset
+        ) / self.pixels_per_unit
+
+    def move_by(self, dx, dy):
+        self.pan += (dx, dy)
+
+    def zoom_at(self, factor, point):
+        """Zoom by `factor` keeping the world position under a screen point in place."""
+        anchor = self.to_world(point)
+        self.zoom = float(np.clip(self.zoom * factor, self.min_zoom, self.max_zoom))
+        self.pan += np.asarray(point, dtype=np.float32) - self.to_screen(anchor)
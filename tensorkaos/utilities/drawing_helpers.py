@@ -1,34 +1,52 @@
-import arcade
-import math
+import numpy as np
 
+from arcade.gl import BufferDescription
 
-def draw_chevron(start_pos, end_pos, color=arcade.color.WHITE, size=10, line_width=2):
-    """
-    Draw a chevron at the midpoint of the path from start_pos to end_pos.
+from .misc import get_assets_path
+
+
+class TriangleBatch:
+    """A retained vertex buffer of colored triangles, drawn with one call.
+
+    Geometry is uploaded with `write` only when it changes, e.g. from the builders in
+    `utilities.geometry`, and zoomed and panned at draw time by uniforms.
     """
-    # Calculate the midpoint
-    mid_pos = ((start_pos[0] + end_pos[0]) / 2, (start_pos[1] + end_pos[1]) / 2)
-
-    # Calculate the angle of the line
-    dx = end_pos[0] - start_pos[0]
-    dy = end_pos[1] - start_pos[1]
-    angle = math.atan2(dy, dx)
-
-    # Calculate the positions for the chevron's "V" arms
-    angle_offset = math.pi / 6  # Adjust this value to change the "V" opening
-    chevron_pos1 = (
-        mid_pos[0] - size * math.cos(angle - angle_offset),
-        mid_pos[1] - size * math.sin(angle - angle_offset),
-    )
-    chevron_pos2 = (
-        mid_pos[0] - size * math.cos(angle + angle_offset),
-        mid_pos[1] - size * math.sin(angle + angle_offset),
-    )
-
-    # Draw the chevron arms
-    arcade.draw_line(
-        mid_pos[0], mid_pos[1], chevron_pos1[0], chevron_pos1[1], color, line_width
-    )
-    arcade.draw_line(
-        mid_pos[0], mid_pos[1], chevron_pos2[0], chevron_pos2[1], color, line_width
-    )
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        shaders = get_assets_path() / "shaders" / "batch"
+        self.program = ctx.program(
+            vertex_shader=(shaders / "vert.glsl").read_text(),
+            fragment_shader=(shaders / "frag.glsl").read_text(),
+        )
+        self.vertices = ctx.buffer(reserve=8 * 1024, usage="dynamic")
+        self.colors = ctx.buffer(reserve=4 * 1024, usage="dynamic")
+        self.geometry = ctx.geometry(
+            [
+                BufferDescription(self.vertices, "2f", ["in_vert"]),
+                BufferDescription(
+                    self.colors, "4f1", ["in_color"], normalized=["in_color"]
+                ),
+            ],
+            mode=ctx.TRIANGLES,
+        )
+        self.count = 0
+
+    def write(self, vertices, colors):
+        """Replace the batch with (n, 2) vertices and their (n, 4) uint8 colors."""
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        colors = np.ascontiguousarray(colors, dtype=np.uint8)
+        for buffer, data in ((self.vertices, vertices), (self.colors, colors)):
+            if data.nbytes > buffer.size:
+                buffer.orphan(size=2 * data.nbytes)
+            if data.nbytes:
+                buffer.write(data)
+        self.count = len(vertices)
+
+    def draw(self, offset=(0, 0), zoom=1.0):
+        if not self.count:
+            return
+        self.program["offset"] = tuple(offset)
+        self.program["zoom"] = zoom
+        self.ctx.enable(self.ctx.BLEND)
+        self.geometry.render(self.program, vertices=self.count)
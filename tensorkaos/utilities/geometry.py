@@ -0,0 +1,124 @@
+""" Vectorized triangle geometry for batched drawing.
+
+Every function builds the triangles of many primitives at once, as a (vertices, 2) float32
+array meant for a GL_TRIANGLES vertex buffer. Nothing here touches the GPU, so batches can be
+built and checked without a window.
+"""
+
+import math
+import numpy as np
+
+
+def line_quads(start, end, width):
+    """Two triangles per line segment, from (n, 2) start and end points."""
+    start = np.asarray(start, dtype=np.float32).reshape(-1, 2)
+    end = np.asarray(end, dtype=np.float32).reshape(-1, 2)
+    direction = end - start
+    length = np.linalg.norm(direction, axis=1, keepdims=True)
+    normal = direction[:, ::-1] * np.float32([-1, 1]) / np.maximum(length, 1e-6)
+    offset = normal * (width / 2)
+
+    a, b = start + offset, start - offset
+    c, d = end - offset, end + offset
+    return np.stack((a, b, c, a, c, d), axis=1).reshape(-1, 2)
+
+
+def chevron_segments(start, end, size, angle_offset=math.pi / 6):
+    """The two arms of a chevron at the middle of each segment, pointing towards its end.
+
+    Returns (starts, ends) of the 2n arm segments.
+    """
+    start = np.asarray(start, dtype=np.float32).reshape(-1, 2)
+    end = np.asarray(end, dtype=np.float32).reshape(-1, 2)
+    middle = (start + end) / 2
+    angle = np.arctan2(end[:, 1] - start[:, 1], end[:, 0] - start[:, 0])
+
+    arms = []
+    for offset in (-angle_offset, angle_offset):
+        arms.append(
+            middle
+            - size * np.stack((np.cos(angle + offset), np.sin(angle + offset)), axis=1)
+        )
+    ends = np.stack(arms, axis=1).reshape(-1, 2)
+    return np.repeat(middle, 2, axis=0), ends.astype(np.float32)
+
+
+def _unit_circle(segments):
+    angles = np.linspace(0, 2 * math.pi, segments + 1, dtype=np.float32)
+    return np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+
+def discs(centers, radius, segments=16):
+    """A triangle fan of `segments` triangles per filled circle."""
+    centers = np.asarray(centers, dtype=np.float32).reshape(-1, 1, 1, 2)
+    circle = _unit_circle(segments) * radius
+    rim = np.stack((circle[:-1], circle[1:]), axis=1)
+    triangles = np.concatenate((np.zeros((segments, 1, 2), np.float32), rim), axis=1)
+    return (centers + triangles).reshape(-1, 2)
+
+
+def rings(centers, radius, width, segments=24):
+    """Two triangles per segment of each circle outline, `width` wide around `radius`."""
+    centers = np.asarray(centers, dtype=np.float32).reshape(-1, 1, 1, 2)
+    outer = _unit_circle(segments) * (radius + width / 2)
+    inner = _unit_circle(segments) * (radius - width / 2)
+    quads = np.stack(
+        (outer[:-1], inner[:-1], inner[1:], outer[:-1], inner[1:], outer[1:]), axis=1
+    )
+    return (centers + quads).reshape(-1, 2)
+
+
+def colors(color, count, per_primitive=1):
+    """(count * per_primitive, 4) uint8 vertex colors for one RGB(A) color or one per primitive."""
+    color = np.asarray(color, dtype=np.uint8)
+    if color.shape[-1] == 3:
+        alpha = np.full((*color.shape[:-1], 1), 255, dtype=np.uint8)
+        color = np.concatenate((color, alpha), axis=-1)
+    color = np.broadcast_to(color.reshape(-1, 4), (count, 4))
+    return np.repeat(color, per_primitive, axis=0)
+
+
+def concatenate(*parts):
+    """Join (vertices, colors) pairs into one batch."""
+    if not parts:
+        return np.zeros((0, 2), np.float32), np.zeros((0, 4), np.uint8)
+    vertices, vertex_colors = zip(*parts)
+    return np.concatenate(vertices), np.concatenate(vertex_colors)
+
+
+if __name__ == "__main__":
+    # vertex counts of every primitive, and a few vertices that are easy to work out
+    quads = line_quads([(0, 0), (0, 0)], [(10, 0), (0, 4)], width=2)
+    assert quads.shape == (12, 2) and quads.dtype == np.float32
+    assert np.allclose(
+        quads[:6], [(0, 1), (0, -1), (10, -1), (0, 1), (10, -1), (10, 1)]
+    )
+
+    starts, ends = chevron_segments([(0, 0)], [(10, 0)], size=3)
+    assert starts.shape == ends.shape == (2, 2)
+    assert np.allclose(starts, (5, 0))
+    assert np.allclose(np.linalg.norm(ends - starts, axis=1), 3)
+    assert (ends[:, 0] < 5).all() and np.isclose(ends[0, 1], -ends[1, 1])
+
+    fans = discs([(0, 0), (5, 5)], radius=2, segments=16)
+    assert fans.shape == (2 * 3 * 16, 2)
+    assert np.allclose(fans[48::3], (5, 5))
+    assert np.allclose(np.linalg.norm(fans[1:48:3], axis=1), 2)
+
+    outlines = rings([(0, 0)], radius=10, width=2, segments=24)
+    assert outlines.shape == (6 * 24, 2)
+    assert np.allclose(
+        np.sort(np.unique(np.linalg.norm(outlines, axis=1).round(4))), (9, 11)
+    )
+
+    assert colors((1, 2, 3), 2, 3).tolist() == [[1, 2, 3, 255]] * 6
+    assert colors([(1, 2, 3, 4), (5, 6, 7, 8)], 2, 1).tolist() == [
+        [1, 2, 3, 4],
+        [5, 6, 7, 8],
+    ]
+    vertices, vertex_colors = concatenate(
+        (quads, colors((0, 0, 0), 2, 6)), (fans, colors((9, 9, 9), 2, 48))
+    )
+    assert vertices.shape == (108, 2) and vertex_colors.shape == (108, 4)
+    assert concatenate()[0].shape == (0, 2)
+    print("Primitives have the expected vertex counts and shapes.")
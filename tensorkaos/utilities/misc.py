@@ -37,3 +37,13 @@ def get_assets_path():
 
     return assets_path
 
+
+def derive_seed(seed, *keys):
+    """Deterministically mix integer keys into a 64 bit seed (splitmix64)."""
+    mask = (1 << 64) - 1
+    for key in keys:
+        z = (seed + 0x9E3779B97F4A7C15 * (key + 1)) & mask
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+        seed = z ^ (z >> 31)
+    return seed
@@ -0,0 +1,88 @@
+""" A uniform grid index over 2D points, for picking and other small range queries.
+
+Points are bucketed into square cells and sorted by cell, so a query only looks at the points
+of the few cells overlapping its box: a click is answered in microseconds no matter how many
+points there are, as long as they are spread over the grid.
+"""
+
+import numpy as np
+
+
+class GridIndex:
+    def __init__(self, positions, cell_size=None):
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 2)
+        self.positions = positions
+        if not len(positions):
+            self.origin = np.zeros(2, dtype=np.float32)
+            self.shape = (1, 1)
+            self.cell_size = cell_size or 1.0
+            self.order = np.zeros(0, dtype=np.int64)
+            self.starts = np.zeros(2, dtype=np.int64)
+            return
+
+        self.origin = positions.min(axis=0)
+        extent = np.maximum(positions.max(axis=0) - self.origin, 1e-6)
+        if cell_size is None:
+            # about one point per cell when they are spread evenly
+            cell_size = float(np.sqrt(extent[0] * extent[1] / len(positions)))
+            cell_size = max(cell_size, float(extent.max()) / 4096, 1e-6)
+        self.cell_size = cell_size
+        self.shape = tuple((extent // cell_size).astype(np.int64) + 1)
+
+        cells = self._cells(positions)
+        keys = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.order = np.argsort(keys, kind="stable")
+        # starts[k]:starts[k + 1] are the points of cell k in `order`
+        self.starts = np.zeros(self.shape[0] * self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(keys, minlength=self.shape[0] * self.shape[1]),
+            out=self.starts[1:],
+        )
+
+    def _cells(self, points):
+        cells = ((points - self.origin) // self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, np.array(self.shape) - 1)
+
+    def query_box(self, center, half_size):
+        """Ids of the points within `half_size` of `center` along both axes, in id order."""
+        center = np.asarray(center, dtype=np.float32)
+        low, high = self._cells(np.stack((center - half_size, center + half_size)))
+
+        candidates = [
+            self.order[self.starts[key] : self.starts[key + (high[1] - low[1]) + 1]]
+            for key in range(
+                low[0] * self.shape[1] + low[1],
+                high[0] * self.shape[1] + low[1] + 1,
+                self.shape[1],
+            )
+        ]
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.concatenate(candidates)
+        inside = (np.abs(self.positions[candidates] - center) <= half_size).all(axis=1)
+        return np.sort(candidates[inside])
+
+
+if __name__ == "__main__":
+    import time
+
+    # benchmark, picking on 100k points
+    rng = np.random.default_rng(0)
+    size = 100_000
+    positions = rng.uniform(0, 3000, (size, 2)).astype(np.float32)
+
+    start = time.perf_counter()
+    index = GridIndex(positions)
+    print(f"Indexed {size} points in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    queries = rng.uniform(0, 3000, (10_000, 2))
+    start = time.perf_counter()
+    for query in queries:
+        index.query_box(query, 0.15)
+    elapsed = (time.perf_counter() - start) / len(queries)
+    print(f"Box query in {elapsed * 1e6:.1f}us on average")
+
+    for query in queries[:100]:
+        brute = np.flatnonzero((np.abs(positions - query) <= 3).all(axis=1))
+        assert np.array_equal(index.query_box(query, 3), brute)
+    print("Box queries match a brute force scan.")
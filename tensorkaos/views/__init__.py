@@ -1,7 +1,33 @@
-from .title import TitleView
-from .pause import PauseView
-from .gridgame import GridGameView
-from .graphmap import GraphMapView
+""" The game's views, imported when first used.
+
+A view's module can pull in heavy dependencies, numba and networkx for the map, so the
+views are only named here and imported on first access, e.g. `from .views import
+GraphMapView` or `view_factory("map")`.
+"""
+
+from importlib import import_module
+
+# view name -> (module, class)
+VIEWS = {
+    "title": ("title", "TitleView"),
+    "game": ("gridgame", "GridGameView"),
+    "map": ("graphmap", "GraphMapView"),
+    "pause": ("pause", "PauseView"),
+}
+
+
+def view_factory(name):
+    """A callable making the view `name`, which imports its module when called."""
+    module, cls = VIEWS[name]
+    return lambda: getattr(import_module(f".{module}", __name__), cls)()
+
+
+def __getattr__(name):
+    for module, cls in VIEWS.values():
+        if cls == name:
+            return getattr(import_module(f".{module}", __name__), cls)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # re-export all views
-__all__ = [v for v in locals() if v.endswith("View")]
+__all__ = [cls for _, cls in VIEWS.values()]
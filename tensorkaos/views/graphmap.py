@@ -2,14 +2,23 @@ import math
 import os
 import arcade
 import random
-import networkx as nx
+import numpy as np
 
 from ..utilities.misc import setup_logging
-from ..utilities.drawing_helpers import draw_chevron
-from ..core.map.builders.helpers import complicate_map
-from ..core.map.builders.generators import generate_base_complex
+from ..utilities.camera import Camera2D
+from ..utilities.drawing_helpers import TriangleBatch
+from ..utilities.spatial import GridIndex
+from ..core.map.builders.generators import generate_map
+from ..core.map.builders.quality import generate_best_map
+from ..core.map.builders.lazy import expand_near
+from ..core.map.layout import relax_around
+from ..core.map.pathfinding import HierarchicalPathfinder
+from ..core.map.queries import MapQueries
+from ..core.map.pregen import MapPregenerator
+from ..core.map.storage import MapCache
+from ..core.map.world import ChunkedWorld
 
-from ..core.guiview import GuiView
+from .map_batches import build_map_batch, build_highlight_batch
 
 log = setup_logging(__name__)
 
@@ -18,158 +27,328 @@ log = setup_logging(__name__)
 class GraphMapView(arcade.View):
     def __init__(self, window=None):
         super().__init__(window)
-        self.graph = None  # This will store the networkx graph
+        self.graph = None  # This will store the map GraphModule
+        self.world = None  # Streams self.graph in chunks when MAP_STREAMING is set
+        self.seed = None  # Seed the map was generated from
+        self.map_cache = None  # Generated maps on disk, by seed
+        self.pregenerator = None  # Generates the next map in the background
         self.current_node = None
         self.node_size = 15  # Radius of the node for drawing
-        self.map_offset = (self.window.width // 2, self.window.height // 2)
-        self.setup()
-
-    def __set_debug_layout(self):
-        pos = nx.get_node_attributes(self.graph, "position")
-        for _ in range(3):
-            pos = nx.spring_layout(
-                self.graph,
-                pos=pos,
-                scale=2.0,
-                k=15.0,
-                iterations=50,
-                threshold=0.001,
-            )
-            # average the positions with the original positions
-            for node in pos:
-                pos[node] = (
-                    (pos[node][0] + self.graph.nodes[node]["position"][0]) / 2,
-                    (pos[node][1] + self.graph.nodes[node]["position"][1]) / 2,
-                )
+        self.scale = 100  # Pixels per map position unit
+        # retained geometry, rebuilt only when the graph, the view or the current node change
+        self.map_batch = TriangleBatch(self.window.ctx)
+        self.highlight_batch = TriangleBatch(self.window.ctx)
+        self._map_batch_key = None
+        self._map_batch_region = None  # World (low, high) corners the map batch covers
+        self._highlight_batch_key = None
+        self.expand_radius = 2  # Module stubs this many hops away get expanded
+        self.queries = None
+        self.pathfinder = None
+        self.travel_target = None  # Node the player auto-travels to, if any
+        self.travel_interval = 0.2  # Seconds between auto-travel steps
+        self._travel_timer = 0.0
+        self.camera = Camera2D(
+            scale=self.scale, pan=(self.window.width // 2, self.window.height // 2)
+        )
+        self.node_index = None  # Grid index of node positions, for picking and culling
+        self._index_key = None
+        self.lod_threshold = 40  # Below this many pixels per unit modules are collapsed
+        self._module_index = None  # Grid index of the collapsed modules' positions
+        self._module_index_key = None
+        self.hovered_node = None
+        # the map is generated by `setup`, when a game starts or the view is first shown
+
+    def setup(self, seed=None):
+        if seed is None and os.getenv("MAP_SEED"):
+            seed = int(os.getenv("MAP_SEED"))
 
-        nx.set_node_attributes(self.graph, pos, "position")
-        log.debug(f"Graph nodes: {list(self.graph.nodes(data=True))}")
+        if self.world is not None:
+            self.world.close()
+        if os.getenv("MAP_STREAMING", False):
+            self.seed = random.getrandbits(64) if seed is None else seed
+            self.world = ChunkedWorld(seed=self.seed)
+            self.current_node = self.world.update()
+            self.graph = self.world.graph
+        else:
+            self.world = None
+            if seed is None and self.pregenerator is not None:
+                # hand over the map pregenerated while the title screen was up
+                self.seed, self.graph = self.pregenerator.take()
+            else:
+                self.seed = random.getrandbits(64) if seed is None else seed
+                generate, params = self.__get_generator()
+                self.graph = self.__get_map_cache().get(generate, self.seed, **params)
 
-    def setup(self):
-        self.graph = complicate_map(generate_base_complex())
+            self.current_node = self.graph.entry_node
+
+        self.travel_target = None
+        self.__expand_around_current_node()
+
+    def close(self):
+        """Stop the map pregenerator and drop the streamed chunks, the window is closing."""
+        if self.pregenerator is not None:
+            self.pregenerator.close()
+        if self.world is not None:
+            self.world.close()
+
+    def pregenerate(self):
+        """Start generating the next map in the background, if it isn't already."""
+        if os.getenv("MAP_STREAMING", False) or os.getenv("MAP_SEED"):
+            return
+        if self.pregenerator is None:
+            generate, params = self.__get_generator()
+            self.pregenerator = MapPregenerator(
+                self.__get_map_cache(), generate, **params
+            )
+        if self.pregenerator.seed is None:
+            self.pregenerator.start()
 
-        if os.getenv("DEBUG_MAP_LAYOUT", False):
-            self.__set_debug_layout()
+    def __get_map_cache(self):
+        if self.map_cache is None:
+            self.map_cache = MapCache()
+        return self.map_cache
 
-        self.current_node = self.graph.entry_node
+    def __get_generator(self):
+        params = {"layout": bool(os.getenv("DEBUG_MAP_LAYOUT", False))}
+        # with MAP_CANDIDATES set, keep the best of that many candidate maps
+        candidates = int(os.getenv("MAP_CANDIDATES", 0))
+        if candidates:
+            return generate_best_map, {"candidates": candidates, **params}
+        return generate_map, params
 
     def on_show_view(self):
+        if self.graph is None:
+            self.setup()
         arcade.set_background_color(arcade.color.AIR_SUPERIORITY_BLUE)
         return super().on_show_view()
 
     def on_draw(self):
         arcade.start_render()
         # TODO: Calculate scaling factors for dynamic display adjustments, if needed
-        self.__draw_map_edges()
-        self.__draw_map_nodes()
-        self.__draw_map_labels()
+        self.__update_batches()
+        # the batches are in map pixels, the camera's scale is already applied
+        offset, zoom = self.camera.offset, self.camera.zoom
+        self.map_batch.draw(offset, zoom)
+        self.highlight_batch.draw(offset, zoom)
+        self.__draw_hover_label()
 
     def on_mouse_press(self, x, y, button, modifiers):
         if button == arcade.MOUSE_BUTTON_LEFT:
             log.debug(f"Clicked at: {x}, {y}")  # Debugging click positions
-            for node, data in self.graph.nodes(data=True):
-                if self.__clicked_in_node(x, y, node) and node != self.current_node:
-                    log.debug(f"Clicked on node: {node}")
+            for node in self.__pick(x, y).tolist():
+                if node != self.current_node:
+                    log.debug(f"Clicked on node: {self.graph.node_name(node)}")
                     if self.__can_move_to(node):
-                        self.current_node = node
-                        log.debug(f"Moved to {self.current_node}")
+                        self.__move_to(node)
                         break
         elif button == arcade.MOUSE_BUTTON_RIGHT:
             log.debug(f"Right-clicked at: {x}, {y}")
-            self.map_offset += (x, y)
+            # pan the clicked point to the middle of the window
+            self.camera.move_by(self.window.width / 2 - x, self.window.height / 2 - y)
+
+    def on_mouse_motion(self, x, y, dx, dy):
+        picked = self.__pick(x, y)
+        self.hovered_node = int(picked[0]) if len(picked) else None
+
+    def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
+        self.camera.zoom_at(1.1**scroll_y, (x, y))
 
     def on_key_press(self, key, modifiers):
         if key == arcade.key.ESCAPE:
             self.window.show_view("game")
+        elif key == arcade.key.T:
+            # toggle auto-travel to the exit
+            if self.travel_target is None:
+                self.travel_target = self.graph.exit_node
+                if self.world is not None:
+                    self.travel_target = self.world.stable_id(self.travel_target)
+            else:
+                self.travel_target = None
+
+    def on_update(self, delta_time):
+        if self.travel_target is None:
+            return
+        self._travel_timer += delta_time
+        if self._travel_timer < self.travel_interval:
+            return
+        self._travel_timer = 0.0
+
+        goal = self.travel_target
+        if self.world is not None:
+            goal = self.world.node_of(goal)
+        step = None
+        if goal is not None and goal != self.current_node:
+            step = self.__get_pathfinder().next_step(self.current_node, goal)
+        if step is None:
+            self.travel_target = None
+        else:
+            self.__move_to(step)
+
+    def __get_queries(self):
+        if self.queries is None or self.queries.graph is not self.graph:
+            self.queries = MapQueries(self.graph)
+        return self.queries
+
+    def __get_pathfinder(self):
+        # the streamed world replaces its graph when chunks are loaded or evicted
+        if self.pathfinder is None or self.pathfinder.graph is not self.graph:
+            if self.pathfinder is not None:
+                self.pathfinder.close()
+            self.pathfinder = HierarchicalPathfinder(self.graph)
+        return self.pathfinder
+
+    def __move_to(self, node):
+        self.current_node = node
+        if self.world is not None:
+            self.current_node = self.world.update(node)
+            self.graph = self.world.graph
+        log.debug(f"Moved to {self.graph.node_name(self.current_node)}")
+        self.__expand_around_current_node()
+
+    def __expand_around_current_node(self):
+        before = len(self.graph)
+        expanded = expand_near(self.graph, self.current_node, self.expand_radius)
+        if expanded:
+            log.debug(f"Expanded {expanded} module stubs near the current node")
+            if os.getenv("DEBUG_MAP_LAYOUT", False):
+                # only the new modules and their surroundings move
+                relax_around(self.graph, np.arange(before, len(self.graph)))
 
-    def __get_offset_pos(self, pos):
-        new_pos = (
-            self.map_offset[0] + pos[0] * 100,
-            self.map_offset[1] + pos[1] * 100,
+    def __update_camera(self):
+        # keep the current node at the camera's pan point
+        if self.current_node is not None:
+            self.camera.focus[:] = self.graph.positions[self.current_node]
+
+    def __get_node_index(self):
+        # the grid index is over map positions, rebuilt when the graph or layout changes
+        key = (id(self.graph), self.graph.version)
+        if self._index_key != key:
+            self.node_index = GridIndex(self.graph.positions)
+            self._index_key = key
+        return self.node_index
+
+    def __get_module_index(self):
+        # the grid index of the collapsed modules, drawn instead of the nodes zoomed out
+        key = (id(self.graph), self.graph.version)
+        if self._module_index_key != key:
+            _, positions, _, _ = self.__get_queries().collapsed_modules()
+            self._module_index = GridIndex(positions)
+            self._module_index_key = key
+        return self._module_index
+
+    def __pick(self, x, y):
+        """Nodes whose drawn square contains a screen point, in id order.
+
+        Zoomed out the collapsed modules are drawn instead, and a point picks every member
+        of the modules under it.
+        """
+        self.__update_camera()
+        point = self.camera.to_world((x, y))
+        if self.camera.pixels_per_unit >= self.lod_threshold:
+            return self.__get_node_index().query_box(point, self.node_size / self.scale)
+
+        groups = self.__get_queries().collapsed_modules()[0]
+        modules = self.__get_module_index().query_box(
+            point, self.node_size * 2 / self.scale
         )
-        # offset by current node position
-        if self.current_node:
-            current_pos = self.graph.nodes[self.current_node]["position"]
-            new_pos = (
-                new_pos[0] - current_pos[0] * 100,
-                new_pos[1] - current_pos[1] * 100,
-            )
+        return np.flatnonzero(np.isin(groups, modules))
 
-        # clip to window
-        new_pos = self.__clip_pos_to_window(new_pos)
-        return new_pos
-
-    def __draw_map_edges(self):
-        for u, v in self.graph.edges():
-            start_pos = self.graph.nodes[u]["position"]
-            end_pos = self.graph.nodes[v]["position"]
-            visual_start_pos = self.__get_offset_pos(start_pos)
-            visual_end_pos = self.__get_offset_pos(end_pos)
-
-            color = (
-                arcade.color.ORANGE_RED
-                if self.graph.degree(u) % 2 == 0
-                else arcade.color.RASPBERRY_GLACE
-            )
-            arcade.draw_line(*visual_start_pos, *visual_end_pos, color, 2)
-            draw_chevron(
-                visual_start_pos,
-                visual_end_pos,
-                arcade.color.FANDANGO_PINK,
-                size=10,
-                line_width=2,
+    def __get_layer(self, detailed):
+        """(positions, src, dst, degrees, index) of the nodes drawn at a level of detail."""
+        if detailed:
+            src, dst = self.graph.edge_arrays()
+            return (
+                self.graph.positions,
+                src,
+                dst,
+                self.graph.degree(),
+                self.__get_node_index(),
             )
 
-    def __draw_map_nodes(self):
-        # Draw nodes and highlight possible destinations
-        for node, data in self.graph.nodes(data=True):
-            position = data["position"]
-            visual_position = self.__get_offset_pos(position)
-            arcade.draw_circle_filled(
-                *visual_position, self.node_size, arcade.color.ULTRAMARINE_BLUE
-            )
-            if node == self.current_node:
-                arcade.draw_circle_outline(
-                    *visual_position, self.node_size + 5, arcade.color.RASPBERRY_ROSE, 4
+        # zoomed out, every integrated module is drawn as a single node
+        _, positions, src, dst = self.__get_queries().collapsed_modules()
+        degrees = np.bincount(src, minlength=len(positions)) + np.bincount(
+            dst, minlength=len(positions)
+        )
+        return positions, src, dst, degrees, self.__get_module_index()
+
+    def __get_view_region(self):
+        """World (low, high) corners of the window."""
+        return self.camera.to_world([(0, 0), (self.window.width, self.window.height)])
+
+    def __update_batches(self):
+        # the map batch follows graph edits and holds only the nodes and edges around the
+        # viewport, it is rebuilt once the view leaves that region or zooms past the LOD
+        # threshold, so drawing a frame costs what is visible rather than the whole map
+        self.__update_camera()
+        detailed = self.camera.pixels_per_unit >= self.lod_threshold
+        map_key = (id(self.graph), self.graph.version)
+        low, high = self.__get_view_region()
+        region = self._map_batch_region
+        if (
+            self._map_batch_key != (map_key, detailed)
+            or (low < region[0]).any()
+            or (high > region[1]).any()
+            # zoomed far in, don't keep drawing the region of a zoomed out view
+            or ((region[1] - region[0]) > 4 * (high - low)).any()
+        ):
+            # half a window of margin on every side, so small pans don't rebuild
+            margin = (high - low) / 2
+            positions, src, dst, degrees, index = self.__get_layer(detailed)
+            nodes = index.query_box((low + high) / 2, (high - low) / 2 + margin)
+            # edges whose bounding box overlaps the region, which includes the edges
+            # crossing it with both ends outside
+            start, end = positions[src], positions[dst]
+            edges = (
+                (np.minimum(start, end) <= high + margin)
+                & (np.maximum(start, end) >= low - margin)
+            ).all(axis=1)
+            self.map_batch.write(
+                *build_map_batch(
+                    positions,
+                    src[edges],
+                    dst[edges],
+                    degrees,
+                    nodes,
+                    self.scale,
+                    self.node_size if detailed else self.node_size * 2,
+                    (
+                        arcade.color.ULTRAMARINE_BLUE
+                        if detailed
+                        else arcade.color.PURPLE_HEART
+                    ),
                 )
+            )
+            self._map_batch_key = (map_key, detailed)
+            self._map_batch_region = (low - margin, high + margin)
 
-    def __draw_map_labels(self):
-        # Highlight neighbors (possible destinations) of the current node
-        for neighbor in self.graph.neighbors(self.current_node):
-            neighbor_pos = self.graph.nodes[neighbor]["position"]
-            visual_neighbor_pos = self.__get_offset_pos(neighbor_pos)
-            arcade.draw_circle_outline(
-                *visual_neighbor_pos, self.node_size + 10, arcade.color.YELLOW, 3
-            )  # Larger yellow circle
-            # also highight neighbors of neighbors with two yellow circles
-            for nn in self.graph.neighbors(neighbor):
-                nn_pos = self.graph.nodes[nn]["position"]
-                visual_nn_pos = self.__get_offset_pos(nn_pos)
-                arcade.draw_circle_outline(
-                    *visual_nn_pos, self.node_size + 15, arcade.color.OCEAN_BOAT_BLUE, 3
+        highlight_key = (map_key, self.current_node)
+        if self._highlight_batch_key != highlight_key:
+            neighbors, second = self.__get_queries().rings(self.current_node, 2)
+            self.highlight_batch.write(
+                *build_highlight_batch(
+                    self.graph,
+                    self.current_node,
+                    neighbors,
+                    second,
+                    self.scale,
+                    self.node_size,
                 )
+            )
+            self._highlight_batch_key = highlight_key
 
-    def __clicked_in_node(self, x, y, node):
-        position = self.graph.nodes[node]["position"]
-        visual_position = self.__get_offset_pos(position)
-        inside_x = (
-            visual_position[0] - self.node_size
-            <= x
-            <= visual_position[0] + self.node_size
-        )
-        inside_y = (
-            visual_position[1] - self.node_size
-            <= y
-            <= visual_position[1] + self.node_size
+    def __draw_hover_label(self):
+        if self.hovered_node is None or self.hovered_node >= len(self.graph):
+            return
+        x, y = self.camera.to_screen(self.graph.positions[self.hovered_node]).tolist()
+        offset = self.node_size * self.camera.zoom
+        arcade.draw_text(
+            self.graph.node_name(self.hovered_node),
+            x + offset,
+            y + offset,
+            arcade.color.WHITE,
+            12,
         )
 
-        return inside_x and inside_y
-
     def __can_move_to(self, node):
-        return node in [n for n in self.graph.neighbors(self.current_node)]
-
-    def __clip_pos_to_window(self, pos):
-        x, y = pos
-        x = max(self.node_size, min(x, self.window.width - self.node_size))
-        y = max(self.node_size, min(y, self.window.height - self.node_size))
-        return x, y
+        return self.__get_queries().can_move(self.current_node, node)
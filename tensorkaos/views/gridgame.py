@@ -1,136 +1,82 @@
+import math
 import numpy as np
-import random
 import arcade
-from arcade.gl import BufferDescription
 
-from ..utilities.misc import get_assets_path, setup_logging
+from ..core.engine.compute_entity_manager import ComputeEntityManager
+from ..core.engine.entity_pool import EntityPool
+from ..core.swarm.backend import create_swarm
+from ..core.swarm.lod import UpdateTiers
+from ..utilities.misc import setup_logging
 
 log = setup_logging(__name__)
 
-
-class ShaderGroup:
-    def __init__(self, context, shader_source, buffer_descriptions):
-        self.context = context
-        self.shader = context.compute_shader(source=shader_source)
-        self.sprites = arcade.SpriteList()
-        self.buffer_descriptions = (
-            buffer_descriptions  # This is now a list of BufferDescription
-        )
-
-    def add_sprites(self, sprites):
-        self.sprites.extend(sprites)
-        # Since buffer setup is already handled during initialization, you may not need to do it here again
-
-    def update_sprites(self):
-        # Update data in buffers if necessary before running the shader
-        # Bind buffers and run the shader
-        self.shader.run(group_x=len(self.sprites) // 256 + 1)
-
-    def draw(self):
-        self.sprites.draw()
-
-
-class ComputeShaderManager:
-    def __init__(self, context):
-        self.context = context
-        self.shader_groups = {}
-
-    def create_shader_group(self, name, shader_source, buffer_descriptions):
-        self.shader_groups[name] = ShaderGroup(
-            self.context, shader_source, buffer_descriptions
-        )
-
-    def add_sprites_to_group(self, name, sprites):
-        if name in self.shader_groups:
-            self.shader_groups[name].add_sprites(sprites)
-
-    def on_update(self):
-        for group in self.shader_groups.values():
-            group.update_sprites()
-
-    def draw(self):
-        for group in self.shader_groups.values():
-            group.draw()
+# every texture a swarm entity can wear, packed into the entity pool's atlas
+SWARM_TEXTURES = (":resources:images/enemies/slimeBlue.png",)
 
 
 class BoidSwarmEntity(arcade.Sprite):
-    def __init__(
-        self,
-        image_file,
-        scale,
-        shader_group_name,
-        target=None,
-        manager=None,
-        *args,
-        **kwargs
-    ):
+    def __init__(self, image_file=None, scale=1, target=None, *args, **kwargs):
         super().__init__(image_file, scale, *args, **kwargs)
         self.target = target
 
     def update(self):
-        # Update logic now handled by ComputeShaderManager and its shaders
-        # The 'update' method could be used for other non-GPU-related updates if necessary
+        # Update logic is handled by the swarm backend, see ComputeEntityManager.update
+        # The 'update' method could be used for other per-boid updates if necessary
         pass
 
 
 class GridGameView(arcade.View):
     def __init__(self, window=None):
         super().__init__(window)
-        self.manager = ComputeShaderManager(self.window.ctx)
-
-        cshader_path = get_assets_path() / "shaders" / "compute" / "swarm_target.glsl"
-        with open(cshader_path) as file:
-            shader_source = file.read()
-
-        # Combining position and angle data in one buffer
-        buffer = self.manager.context.buffer(
-            reserve=100 * (8 + 4)
-        )  # Reserve for 2 floats for pos and 1 float for angle per entity
-        buffer_description = BufferDescription(
-            buffer=buffer,
-            formats="2f 1f",  # vec2 for position, float for angle
-            attributes=["in_pos", "in_angle"],  # Attribute names in the shader
-            instanced=True,
+        # the boids are simulated on the CPU unless SWARM_BACKEND asks for the GPU, and
+        # their sprites moved in bulk from the simulation's arrays
+        self.manager = ComputeEntityManager()
+        self.target = arcade.SpriteCircle(10, arcade.color.RED, 10)
+        # boid sprites are made once and recycled by every new game
+        self.pool = EntityPool(
+            [arcade.load_texture(path) for path in SWARM_TEXTURES],
+            capacity=1000,
+            scale=0.1,
+            sprite_type=BoidSwarmEntity,
+            target=self.target,
         )
-
-        # Pass the single BufferDescription
-        self.manager.create_shader_group("boids", shader_source, [buffer_description])
         self.setup()
 
-    def setup(self, grid_size=(10, 10)):
+    def setup(self, grid_size=(10, 10), boid_count=100):
         self.menu_area_height = 100
         self.grid_size = grid_size
         self.game_over = False
 
         # create a swarm of entities
-        target = arcade.SpriteCircle(10, arcade.color.RED, 10)
-        target.center_x = self.window.width // 2
-        target.center_y = self.window.height // 2
-        self.target = target
-
-        positions = []
-        angles = []
-
-        # Create and add boids to the manager
-        for _ in range(100):
-            x = random.uniform(0, self.window.width)
-            y = random.uniform(0, self.window.height)
-            angle = random.uniform(0, 360)
-            positions.extend([x, y])
-            angles.append(angle)
-
-            boid = BoidSwarmEntity(
-                ":resources:images/enemies/slimeBlue.png",
-                0.1,
-                "boids",
-                target=self.target,
-                manager=self.manager,
-            )
-            self.manager.add_sprites_to_group("boids", [boid])
-
-        # Populate the buffer with initial data
-        buffer = self.manager.shader_groups["boids"].buffer_descriptions[0].buffer
-        buffer.write(np.array(positions + angles, dtype=np.float32).tobytes())
+        self.target.center_x = self.window.width // 2
+        self.target.center_y = self.window.height // 2
+
+        positions = np.stack(
+            (
+                np.random.uniform(0, self.window.width, boid_count),
+                np.random.uniform(0, self.window.height, boid_count),
+            ),
+            axis=1,
+        )
+        angles = np.random.uniform(-math.pi, math.pi, boid_count)
+        group = self.manager.groups.get("boids")
+        if group is not None and len(group.swarm) == boid_count:
+            # the same number of boids as last game, start them over in place
+            self.manager.reset_group("boids", positions, angles)
+            return
+        if group is not None:
+            self.pool.release(self.manager.remove_group("boids").slots)
+
+        swarm = create_swarm(positions, angles, ctx=self.window.ctx)
+        log.debug(f"Simulating {boid_count} boids with {type(swarm).__name__}")
+        # boids far from the target or off screen steer less often, once there are many
+        self.manager.add_group(
+            "boids",
+            swarm,
+            self.pool.sprites,
+            UpdateTiers(),
+            self.pool.acquire(boid_count),
+        )
 
     def on_draw(self):
         arcade.start_render()
@@ -168,7 +114,11 @@ class GridGameView(arcade.View):
     def on_update(self, delta_time):
         """Update the state of the game each frame."""
         super().on_update(delta_time)
-        self.manager.on_update()
+        self.manager.update(
+            delta_time,
+            (self.target.center_x, self.target.center_y),
+            (0, self.menu_area_height, self.window.width, self.window.height),
+        )
 
     def on_key_press(self, key, modifiers):
         if key == arcade.key.ESCAPE:
@@ -0,0 +1,108 @@
+""" Batched geometry for GraphMapView, built on the CPU without touching the GPU.
+
+The map batch holds the edges, chevrons and nodes around the viewport and only has to be
+rebuilt when the graph changes or the view leaves the region it was built for. The
+highlight batch marks the current node and the nodes one and two hops away and is rebuilt
+when the player moves. Both are in map pixels: node positions times `scale`.
+"""
+
+import arcade
+import numpy as np
+
+from ..utilities import geometry
+
+
+def build_map_batch(
+    positions,
+    src,
+    dst,
+    degrees,
+    nodes,
+    scale,
+    node_size,
+    node_color=arcade.color.ULTRAMARINE_BLUE,
+):
+    """(vertices, colors) of some edges, their chevrons and some nodes of a map.
+
+    `positions` and `degrees` are of every node, `src` and `dst` the edges to draw and
+    `nodes` the nodes to draw, so a batch can hold only what is in view.
+    """
+    positions = positions * scale
+    start, end = positions[src], positions[dst]
+
+    even = (degrees[src] % 2 == 0)[:, None]
+    edge_colors = np.where(
+        even, arcade.color.ORANGE_RED, arcade.color.RASPBERRY_GLACE
+    ).astype(np.uint8)
+
+    arm_start, arm_end = geometry.chevron_segments(start, end, size=10)
+    return geometry.concatenate(
+        (geometry.line_quads(start, end, 2), geometry.colors(edge_colors, len(src), 6)),
+        (
+            geometry.line_quads(arm_start, arm_end, 2),
+            geometry.colors(arcade.color.FANDANGO_PINK, len(arm_start), 6),
+        ),
+        (
+            geometry.discs(positions[nodes], node_size),
+            geometry.colors(node_color, len(nodes), 3 * 16),
+        ),
+    )
+
+
+def build_highlight_batch(graph, current, neighbors, second, scale, node_size):
+    """(vertices, colors) of the rings around the current node and the nodes near it."""
+    positions = graph.positions * scale
+    parts = []
+    for nodes, radius, width, color in (
+        ([current], node_size + 5, 4, arcade.color.RASPBERRY_ROSE),
+        (neighbors, node_size + 10, 3, arcade.color.YELLOW),
+        (second, node_size + 15, 3, arcade.color.OCEAN_BOAT_BLUE),
+    ):
+        parts.append(
+            (
+                geometry.rings(positions[nodes], radius, width),
+                geometry.colors(color, len(nodes), 6 * 24),
+            )
+        )
+    return geometry.concatenate(*parts)
+
+
+if __name__ == "__main__":
+    from ..core.map.module import GraphModule
+    from ..utilities.camera import Camera2D
+
+    # a square of four nodes with a diagonal
+    graph = GraphModule()
+    for position in ((0, 0), (1, 0), (1, 1), (0, 1)):
+        graph.add_node("node", position)
+    graph.add_edges_from([(0, 1), (1, 2), (2, 3), (3, 0), (0, 2)])
+    src, dst = graph.edge_arrays()
+    scale, node_size = 100, 15
+
+    # 6 vertices per edge, 12 per chevron and 48 per node, with a color each
+    vertices, vertex_colors = build_map_batch(
+        graph.positions, src, dst, graph.degree(), [0, 1, 2], scale, node_size
+    )
+    edges = len(src)
+    assert len(vertices) == len(vertex_colors) == 6 * edges + 12 * edges + 48 * 3
+    # the discs come last, each fan starting from its node in map pixels
+    centers = vertices[18 * edges :: 3][::16]
+    assert np.allclose(centers, graph.positions[:3] * scale)
+
+    # the shader's zoom and offset put the nodes where the camera maps them
+    camera = Camera2D(scale=scale, pan=(400, 300), zoom=1.5)
+    camera.focus[:] = graph.positions[2]
+    assert np.allclose(
+        centers * camera.zoom + camera.offset, camera.to_screen(graph.positions[:3])
+    )
+    assert np.allclose(centers[2] * camera.zoom + camera.offset, camera.pan)
+
+    vertices, vertex_colors = build_highlight_batch(
+        graph, 0, [1, 2, 3], [], scale, node_size
+    )
+    assert len(vertices) == len(vertex_colors) == 6 * 24 * 4
+    rim = np.linalg.norm(vertices[: 6 * 24] - graph.positions[0] * scale, axis=1)
+    assert np.isclose(rim.min(), node_size + 5 - 2) and np.isclose(
+        rim.max(), node_size + 5 + 2
+    )
+    print("Map batches have the expected vertex counts and land under the camera.")
@@ -36,6 +36,8 @@ class TitleView(arcade.View):
     def on_show_view(self):
         arcade.set_background_color(arcade.color.BLACK)
         self.uimanager.enable()
+        # generate the next map while the title screen is up, once it is drawn
+        self.window.after_first_frame(lambda: self.window.views["map"].pregenerate())
 
     def on_hide_view(self):
         self.uimanager.disable()
@@ -1,49 +1,150 @@
+import time
+
+_import_started = time.perf_counter()
+
+from collections.abc import Mapping
+
 import arcade
-import imgui
+import pyglet
+
+from .utilities.misc import setup_logging
+from .views import VIEWS, view_factory
+
+log = setup_logging(__name__)
+
+
+class LazyViews(Mapping):
+    """Views by name, each made by its factory the first time it is looked up."""
+
+    def __init__(self, factories, timings=None):
+        self.factories = factories
+        self.timings = {} if timings is None else timings  # Seconds to make each view
+        self._views = {}
+
+    def __getitem__(self, name):
+        view = self._views.get(name)
+        if view is None:
+            start = time.perf_counter()
+            view = self._views[name] = self.factories[name]()
+            self.timings[f"{name} view"] = time.perf_counter() - start
+            log.debug(f"Made the {name} view in {self.timings[f'{name} view']:.3f}s")
+        return view
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self):
+        return len(self.factories)
 
-from arcade_imgui import ArcadeRenderer
+    def made(self):
+        """The views made so far, by name."""
+        return dict(self._views)
 
-from .views import *
+    def pending(self):
+        return [name for name in self.factories if name not in self._views]
 
 
 class TensorKaos(arcade.Window):
-    def __init__(self):
+    def __init__(self, warm_up=True):
+        start = time.perf_counter()
+        # phase -> seconds, logged once the first frame is up
+        self.startup_times = {"imports": start - _import_started}
         super().__init__(
             1280,
             720,
             "TensorKaos: on the edge of chaos, there is also order.",
-            gl_version=(4, 3),
+            gl_version=(3, 3),
             resizable=False,
             antialiasing=True,
         )
+        self.startup_times["window"] = time.perf_counter() - start
 
-        imgui.create_context()
-        self.renderer = ArcadeRenderer(self)
+        self._renderer = None
         self.view_metrics = False
 
-        self.views = {
-            "title": TitleView(),
-            "game": GridGameView(),
-            "map": GraphMapView(),
-            "pause": PauseView(),
-        }
+        # views are made when first shown, or after the first frame when warming up
+        self.views = LazyViews(
+            {name: view_factory(name) for name in VIEWS}, self.startup_times
+        )
+        self.warm_up = warm_up
+        self._started = start
+        self._first_frame = False
+        self._after_first_frame = []
 
         self._last_view = None
         self.show_view("title")
         self.center_window()
 
+    @property
+    def renderer(self):
+        """The imgui renderer, with imgui imported and its context made on first use."""
+        if self._renderer is None:
+            import imgui
+            from arcade_imgui import ArcadeRenderer
+
+            imgui.create_context()
+            self._renderer = ArcadeRenderer(self)
+        return self._renderer
+
     def show_view(self, view):
         if view not in self.views:
             raise ValueError(f"View '{view}' does not exist.")
 
         # get the key of the current view
+        made = self.views.made()
         if self._current_view is not None and type(self._current_view) in [
-            type(x) for x in self.views.values()
+            type(x) for x in made.values()
         ]:
-            key = {v: k for k, v in self.views.items()}[self._current_view]
+            key = {v: k for k, v in made.items()}[self._current_view]
             self._last_view = key
 
         super().show_view(self.views[view])
 
+    def after_first_frame(self, callback):
+        """Call `callback` once the first frame is up, or now if it already is."""
+        if self._first_frame:
+            callback()
+        else:
+            self._after_first_frame.append(callback)
+
+    def flip(self):
+        super().flip()
+        if self._first_frame:
+            return
+        self._first_frame = True
+        self.startup_times["first frame"] = time.perf_counter() - self._started
+        self.__report_startup()
+        for callback in self._after_first_frame:
+            callback()
+        self._after_first_frame.clear()
+        if self.warm_up:
+            pyglet.clock.schedule_once(self.__warm_up_next, 0)
+
+    def __warm_up_next(self, _delta_time):
+        # one view per frame, so the title screen keeps drawing meanwhile
+        pending = self.views.pending()
+        if pending:
+            self.views[pending[0]]
+            pyglet.clock.schedule_once(self.__warm_up_next, 0)
+
+    def __report_startup(self):
+        times = self.startup_times
+        phases = ", ".join(
+            f"{phase} {seconds:.3f}s"
+            for phase, seconds in times.items()
+            if phase != "first frame"
+        )
+        log.info(
+            f"First frame {times['imports'] + times['first frame']:.3f}s after import:"
+            f" {phases}"
+        )
+
     def request_close(self):
         self.close()
+
+    def close(self):
+        # views release what would outlive the window, like the map pregenerator's process
+        for view in self.views.made().values():
+            if hasattr(view, "close"):
+                view.close()
+        super().close()